@@ -0,0 +1,242 @@
+import csv
+import hmac
+import io
+import os
+import tempfile
+from functools import wraps
+
+from flask import Response, request, stream_with_context
+from werkzeug.wsgi import ClosingIterator
+
+import results_store
+
+# --- ORGANIZER ENDPOINTS ---
+# Endpoints for the study organizers, protected with HTTP basic auth
+# (ADMIN_USER / ADMIN_PASSWORD). They are disabled when no ADMIN_PASSWORD
+# is configured.
+
+ADMIN_USER = os.environ.get("ADMIN_USER", "admin")
+ADMIN_PASSWORD = os.environ.get("ADMIN_PASSWORD")
+
+EXPORT_CHUNK_ROWS = 1000
+STREAM_CHUNK_BYTES = 64 * 1024
+
+
+def require_admin(view):
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if not ADMIN_PASSWORD:
+            return Response("Chức năng quản trị chưa được bật (ADMIN_PASSWORD).", status=403)
+        auth = request.authorization
+        if (auth is None
+                or not hmac.compare_digest(auth.username or "", ADMIN_USER)
+                or not hmac.compare_digest(auth.password or "", ADMIN_PASSWORD)):
+            return Response("Cần đăng nhập quản trị.", status=401,
+                            headers={"WWW-Authenticate": 'Basic realm="admin"'})
+        return view(*args, **kwargs)
+    return wrapped
+
+
+def _filters():
+    """
+    Export filters from the query string: study, username, sample, since,
+    until ("YYYY-MM-DD" or "YYYY-MM-DD HH:MM:SS"). A bare `until` date
+    includes the whole day.
+    """
+    until = request.args.get("until") or None
+    if until is not None and len(until) == 10:
+        until += " 23:59:59"
+    return {
+        "study": request.args.get("study") or None,
+        "username": request.args.get("username") or None,
+        "sample": request.args.get("sample") or None,
+        "since": request.args.get("since") or None,
+        "until": until,
+    }
+
+
+def _columns(filters):
+    """
+    First pass over the records: the union of their keys in order of first
+    appearance, and for each column whether all its values are numeric.
+    Only one chunk of records is in memory at a time.
+    """
+    columns = {}
+    for chunk in results_store.iter_records(chunk_size=EXPORT_CHUNK_ROWS, **filters):
+        for record in chunk:
+            for key, value in record.items():
+                numeric = columns.get(key, True)
+                if value is not None and value != "":
+                    numeric = numeric and isinstance(value, (int, float)) and not isinstance(value, bool)
+                columns[key] = numeric
+    return columns
+
+
+def _rows(filters, columns):
+    for chunk in results_store.iter_records(chunk_size=EXPORT_CHUNK_ROWS, **filters):
+        yield [[record.get(column) for column in columns] for record in chunk]
+
+
+def _stream_csv(filters, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM so that Excel opens the UTF-8 file with the Vietnamese text intact
+    buffer.write("\ufeff")
+    writer.writerow(columns)
+    for rows in _rows(filters, columns):
+        writer.writerows(rows)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+def _stream_file(path):
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(STREAM_CHUNK_BYTES)
+            if not data:
+                break
+            yield data
+
+
+def _remove(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def _write_xlsx(filters, columns, path):
+    from openpyxl import Workbook
+
+    # write_only workbooks stream rows to disk instead of keeping cells in memory
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("results")
+    sheet.append(list(columns))
+    for rows in _rows(filters, columns):
+        for row in rows:
+            sheet.append(row)
+    workbook.save(path)
+
+
+def _write_parquet(filters, columns, path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(column, pa.float64() if numeric else pa.string()) for column, numeric in columns.items()])
+    with pq.ParquetWriter(path, schema) as writer:
+        for rows in _rows(filters, columns):
+            arrays = []
+            for i, (column, numeric) in enumerate(columns.items()):
+                values = [row[i] for row in rows]
+                if numeric:
+                    values = [None if v is None or v == "" else float(v) for v in values]
+                else:
+                    values = [None if v is None else str(v) for v in values]
+                arrays.append(pa.array(values, type=schema.field(column).type))
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+
+
+FORMATS = {
+    "csv": ("text/csv; charset=utf-8", None),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", _write_xlsx),
+    "parquet": ("application/vnd.apache.parquet", _write_parquet),
+}
+
+
+@require_admin
+def export_results():
+    """
+    GET /admin/export?format=csv|xlsx|parquet&study=&since=&until=&sample=&username=
+
+    Streams every collected record matching the filters. CSV is generated
+    chunk by chunk while it is sent; XLSX (openpyxl write-only mode) and
+    Parquet (pyarrow, optional) are written chunk by chunk to a temporary
+    file which is then streamed and removed.
+    """
+    fmt = request.args.get("format", "csv").lower()
+    if fmt not in FORMATS:
+        return Response(f"Định dạng không hỗ trợ: {fmt}", status=400)
+    if fmt == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            return Response("Xuất Parquet cần cài đặt gói 'pyarrow'.", status=501)
+
+    filters = _filters()
+    columns = _columns(filters)
+    mimetype, writer = FORMATS[fmt]
+    headers = {"Content-Disposition": f'attachment; filename="ket_qua_tong_hop.{fmt}"'}
+    if writer is None:
+        return Response(stream_with_context(_stream_csv(filters, columns)), mimetype=mimetype, headers=headers)
+
+    fd, path = tempfile.mkstemp(suffix="." + fmt)
+    os.close(fd)
+    try:
+        writer(filters, columns, path)
+    except Exception:
+        os.unlink(path)
+        raise
+    headers["Content-Length"] = str(os.path.getsize(path))
+    # The WSGI server closes the body even if the client went away before the
+    # first chunk (when the generator never started), so the file is removed
+    # then. Response.call_on_close is not used: with direct_passthrough the
+    # body reaches the server unwrapped and those callbacks never run.
+    body = ClosingIterator(_stream_file(path), lambda: _remove(path))
+    return Response(body, mimetype=mimetype, headers=headers, direct_passthrough=True)
+
+
+ANALYTICS_PAGE = """<!DOCTYPE html>
+<html lang="vi"><head><meta charset="utf-8"><title>Phân tích kết quả</title>
+<style>body{{font-family:sans-serif;margin:2em}}table{{border-collapse:collapse;margin-bottom:2em}}
+td,th{{border:1px solid #ccc;padding:4px 8px;text-align:right}}</style></head><body>
+<h2>Mức độ ưa thích chung theo mẫu</h2>{liking}
+<h2>Phân tích JAR (dung sai ±{tolerance:g})</h2>{penalties}
+<h2>Xếp hạng (Friedman)</h2>{ranks}<p>{friedman}</p>
+</body></html>"""
+
+
+def _friedman_text(result):
+    if result["statistic"] is None:
+        return f"{result['rankings']} lượt xếp hạng; chưa đủ điều kiện cho kiểm định Friedman."
+    return (f"{result['rankings']} lượt xếp hạng, {result['samples']} mẫu: "
+            f"Q = {result['statistic']:.3f}, df = {result['df']}, p = {result['p_value']:.4g}")
+
+
+@require_admin
+def analytics_view():
+    """
+    GET /admin/analytics[?study=<code>][&format=json]
+
+    Liking, JAR penalty and Friedman rank-sum tables of one study (all
+    records without `study`), refreshed from the records stored since the
+    previous view (see analytics.py).
+    """
+    import analytics
+
+    jar = analytics.for_study(request.args.get("study") or None)
+    jar.refresh()
+    liking = jar.liking()
+    penalties = jar.penalties()
+    ranks, friedman = jar.friedman()
+    if request.args.get("format") == "json":
+        def records(frame):
+            return frame.astype(object).where(frame.notna(), None).to_dict("records")
+        return {"study": jar.study, "tolerance": jar.tolerance, "liking": records(liking),
+                "penalties": records(penalties), "ranks": records(ranks), "friedman": friedman}
+    return Response(ANALYTICS_PAGE.format(
+        liking=liking.to_html(index=False, float_format="%.2f", na_rep=""),
+        tolerance=jar.tolerance,
+        penalties=penalties.to_html(index=False, float_format="%.2f", na_rep=""),
+        ranks=ranks.to_html(index=False, float_format="%.2f", na_rep=""),
+        friedman=_friedman_text(friedman),
+    ), mimetype="text/html")
+
+
+def register(server):
+    """
+    Adds the organizer endpoints to the Flask server.
+    """
+    server.add_url_rule("/admin/export", "admin_export", export_results)
+    server.add_url_rule("/admin/analytics", "admin_analytics", analytics_view)
@@ -0,0 +1,239 @@
+import math
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+import metrics
+import results_store
+
+# --- JAR PENALTY / LIKING ANALYTICS ---
+# Running aggregates for just-about-right (JAR) penalty analysis, kept as
+# NumPy arrays indexed by [sample, attribute, group]. refresh() only reads
+# the records stored since the previous refresh (by id high-water mark) and
+# folds them in with np.add.at, so keeping the dashboard current costs time
+# proportional to the new records, never to the whole study.
+#
+# Intensities are on the 1-100 sliders; a rating is "just about right" for
+# an attribute when |sample intensity - ideal intensity| <= JAR_TOLERANCE,
+# otherwise "too little" (below ideal) or "too much" (above ideal).
+
+JAR_TOLERANCE = float(os.environ.get("JAR_TOLERANCE", "10"))
+
+TOO_LITTLE, JUST_RIGHT, TOO_MUCH = 0, 1, 2
+
+
+def _chi2_sf(x, df):
+    """
+    Survival function of the chi-square distribution for integer `df`
+    (closed form, so no scipy dependency).
+    """
+    if df <= 0 or x <= 0:
+        return 1.0
+    half = x / 2
+    if df % 2 == 0:
+        term = total = 1.0
+        for i in range(1, df // 2):
+            term *= half / i
+            total += term
+        return math.exp(-half) * total
+    total = math.erfc(math.sqrt(half))
+    term = math.exp(-half) / math.sqrt(math.pi * half)
+    for i in range(1, (df + 1) // 2):
+        term *= half / (i - 0.5)
+        total += term
+    return total
+
+
+class JarAnalytics:
+    """
+    Incrementally maintained liking, JAR penalty and ranking aggregates of
+    one study (or of every record when `study` is None).
+    """
+
+    def __init__(self, study=None, tolerance=JAR_TOLERANCE):
+        self.study = study
+        self.tolerance = tolerance
+        self._lock = threading.Lock()
+        self.samples = {}
+        self.attributes = {}
+        self.last_rating_id = 0
+        self.last_ranking_id = 0
+        # per sample
+        self.ratings = np.zeros(0)
+        self.liking_sum = np.zeros(0)
+        self.liking_sq_sum = np.zeros(0)
+        # per [sample, attribute]
+        self.deviation_sum = np.zeros((0, 0))
+        self.abs_deviation_sum = np.zeros((0, 0))
+        # per [sample, attribute, group]
+        self.group_count = np.zeros((0, 0, 3))
+        self.group_liking_sum = np.zeros((0, 0, 3))
+        # per sample / per position
+        self.rank_sum = np.zeros(0)
+        self.rank_count = np.zeros(0)
+        self.rankings = 0
+        self.positions = 0
+
+    def _indices(self, mapping, values):
+        """
+        Vectorized lookup of `values` in `mapping` (label -> index), adding
+        unseen labels.
+        """
+        uniques, inverse = np.unique(np.asarray(values, dtype=object), return_inverse=True)
+        codes = np.array([mapping.setdefault(label, len(mapping)) for label in uniques], dtype=np.intp)
+        return codes[inverse]
+
+    def _grow(self):
+        n_samples, n_attributes = len(self.samples), len(self.attributes)
+
+        def pad(array, shape):
+            if array.shape == shape:
+                return array
+            grown = np.zeros(shape)
+            grown[tuple(slice(0, n) for n in array.shape)] = array
+            return grown
+
+        self.ratings = pad(self.ratings, (n_samples,))
+        self.liking_sum = pad(self.liking_sum, (n_samples,))
+        self.liking_sq_sum = pad(self.liking_sq_sum, (n_samples,))
+        self.deviation_sum = pad(self.deviation_sum, (n_samples, n_attributes))
+        self.abs_deviation_sum = pad(self.abs_deviation_sum, (n_samples, n_attributes))
+        self.group_count = pad(self.group_count, (n_samples, n_attributes, 3))
+        self.group_liking_sum = pad(self.group_liking_sum, (n_samples, n_attributes, 3))
+        self.rank_sum = pad(self.rank_sum, (n_samples,))
+        self.rank_count = pad(self.rank_count, (n_samples,))
+
+    def add_ratings(self, rating_rows, attribute_rows):
+        """
+        Folds in rows as returned by results_store.ratings_after.
+        """
+        if rating_rows:
+            _, samples, liking = zip(*rating_rows)
+            s = self._indices(self.samples, samples)
+            liking = np.array(liking, dtype=float)
+            self._grow()
+            np.add.at(self.ratings, s, 1)
+            np.add.at(self.liking_sum, s, liking)
+            np.add.at(self.liking_sq_sum, s, liking ** 2)
+        if attribute_rows:
+            _, samples, liking, attributes, sample_values, ideal_values = zip(*attribute_rows)
+            s = self._indices(self.samples, samples)
+            a = self._indices(self.attributes, attributes)
+            liking = np.array(liking, dtype=float)
+            deviation = np.array(sample_values, dtype=float) - np.array(ideal_values, dtype=float)
+            group = np.where(deviation < -self.tolerance, TOO_LITTLE,
+                             np.where(deviation > self.tolerance, TOO_MUCH, JUST_RIGHT))
+            self._grow()
+            np.add.at(self.deviation_sum, (s, a), deviation)
+            np.add.at(self.abs_deviation_sum, (s, a), np.abs(deviation))
+            np.add.at(self.group_count, (s, a, group), 1)
+            np.add.at(self.group_liking_sum, (s, a, group), liking)
+        if rating_rows:
+            self.last_rating_id = max(self.last_rating_id, rating_rows[-1][0])
+
+    def add_rankings(self, position_rows):
+        """
+        Folds in rows as returned by results_store.ranking_positions_after.
+        """
+        if not position_rows:
+            return
+        ranking_ids, positions, samples = zip(*position_rows)
+        s = self._indices(self.samples, samples)
+        self._grow()
+        np.add.at(self.rank_sum, s, np.array(positions, dtype=float))
+        np.add.at(self.rank_count, s, 1)
+        self.rankings += len(set(ranking_ids))
+        self.positions = max(self.positions, max(positions))
+        self.last_ranking_id = max(self.last_ranking_id, ranking_ids[-1])
+
+    def refresh(self):
+        """
+        Reads the records stored since the last refresh.
+        """
+        with self._lock, metrics.timed("analytics_refresh_seconds", help="Incremental analytics refresh"):
+            self.add_ratings(*results_store.ratings_after(self.last_rating_id, self.study))
+            self.add_rankings(results_store.ranking_positions_after(self.last_ranking_id, self.study))
+
+    # --- SUMMARIES (cost depends on samples x attributes, not on rows) ---
+    def liking(self):
+        n = self.ratings
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = self.liking_sum / n
+            variance = (self.liking_sq_sum - n * mean ** 2) / (n - 1)
+        return pd.DataFrame({
+            "sample": list(self.samples),
+            "ratings": n.astype(int),
+            "mean_liking": mean,
+            "sd_liking": np.sqrt(np.clip(variance, 0, None)),
+        })
+
+    def penalties(self):
+        """
+        One row per (sample, attribute): mean deviation from ideal, the share
+        of each JAR group, the mean drop in liking of the "too little" and
+        "too much" groups relative to "just about right", and the weighted
+        penalty (mean drop x share).
+        """
+        counts = self.group_count
+        total = counts.sum(axis=2)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            share = counts / total[..., None]
+            mean_liking = self.group_liking_sum / counts
+            drop = mean_liking[..., JUST_RIGHT, None] - mean_liking
+            penalty = drop * share
+            mean_deviation = self.deviation_sum / total
+            mean_abs_deviation = self.abs_deviation_sum / total
+        n_samples, n_attributes = total.shape
+        frame = pd.DataFrame({
+            "sample": np.repeat(np.array(list(self.samples), dtype=object), n_attributes),
+            "attribute": np.tile(np.array(list(self.attributes), dtype=object), n_samples),
+            "n": total.ravel().astype(int),
+            "mean_deviation": mean_deviation.ravel(),
+            "mean_abs_deviation": mean_abs_deviation.ravel(),
+            "pct_too_little": 100 * share[..., TOO_LITTLE].ravel(),
+            "pct_just_right": 100 * share[..., JUST_RIGHT].ravel(),
+            "pct_too_much": 100 * share[..., TOO_MUCH].ravel(),
+            "drop_too_little": drop[..., TOO_LITTLE].ravel(),
+            "drop_too_much": drop[..., TOO_MUCH].ravel(),
+            "penalty_too_little": penalty[..., TOO_LITTLE].ravel(),
+            "penalty_too_much": penalty[..., TOO_MUCH].ravel(),
+        })
+        return frame[frame["n"] > 0].reset_index(drop=True)
+
+    def friedman(self):
+        """
+        Rank sums per sample and the Friedman statistic (rank 1 = best).
+        The test assumes every panelist ranked the same k samples; `complete`
+        is False when that does not hold and the statistic is then omitted.
+        """
+        ranked = self.rank_count > 0
+        table = pd.DataFrame({
+            "sample": np.array(list(self.samples), dtype=object)[ranked],
+            "rankings": self.rank_count[ranked].astype(int),
+            "rank_sum": self.rank_sum[ranked],
+        })
+        table["mean_rank"] = table["rank_sum"] / table["rankings"]
+        n, k = self.rankings, int(ranked.sum())
+        complete = n > 0 and k == self.positions and bool(np.all(self.rank_count[ranked] == n))
+        result = {"rankings": n, "samples": k, "complete": complete, "statistic": None, "df": None, "p_value": None}
+        if complete and k > 1:
+            statistic = 12.0 / (n * k * (k + 1)) * float(np.sum(self.rank_sum[ranked] ** 2)) - 3.0 * n * (k + 1)
+            result.update(statistic=statistic, df=k - 1, p_value=_chi2_sf(statistic, k - 1))
+        return table, result
+
+
+_lock = threading.Lock()
+_by_study = {}
+
+
+def for_study(study=None):
+    """
+    The JarAnalytics of study code `study` (all records when None).
+    """
+    with _lock:
+        aggregates = _by_study.get(study)
+        if aggregates is None:
+            aggregates = _by_study[study] = JarAnalytics(study)
+        return aggregates
@@ -1,96 +1,103 @@
 import dash
 from dash import dcc, html, Input, Output, State, callback, no_update
 import dash_bootstrap_components as dbc
-import pandas as pd
 from datetime import datetime
-import gspread
-from gspread_dataframe import set_with_dataframe
+import importlib.util
 import io
 import os
-from pytz import timezone
 import base64
 
+import admin
+import layouts
+import metrics
+import outbox
+import records
+import results_store
+import sheets
+import studies
+import tracing
+from sessions import sessions
+
 # --- INITIALIZE THE DASH APP ---
-# Using a Bootstrap theme for a clean look
-app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
+# Using a Bootstrap theme for a clean look. The theme (Bootstrap 5) is served
+# from assets/bootstrap.min.css rather than a CDN, so the app also works at
+# venues without internet. Asset URLs carry their modification time, so they
+# can be cached for a long time; responses are gzip-compressed when
+# flask-compress is installed.
+ASSETS_MAX_AGE = int(os.environ.get("ASSETS_MAX_AGE", str(365 * 24 * 3600)))
+app = dash.Dash(__name__, compress=importlib.util.find_spec("flask_compress") is not None)
 server = app.server # Expose server for deployment
+server.config["SEND_FILE_MAX_AGE_DEFAULT"] = ASSETS_MAX_AGE
+
+# Per-callback timing, payload sizes and exceptions, served on /metrics
+metrics.instrument(app)
+
+# TRACE_DIR=<dir> records the main callbacks' requests for offline
+# profiling with benchmarks/replay.py (see tracing.py)
+tracing.install(app)
+
+# Organizer endpoints (bulk export of all results), see admin.py
+admin.register(server)
+
+# EVAL_MODE=client pages through the samples in the browser and submits all
+# ratings plus the ranking at once; the default 'server' mode makes one
+# round trip per sample.
+EVAL_MODE = os.environ.get("EVAL_MODE", "server")
+
+# Logging in again resumes an evaluation left unfinished within this many
+# hours at the next sample (0 turns resuming off)
+RESUME_MAX_AGE_HOURS = float(os.environ.get("RESUME_MAX_AGE_HOURS", "12"))
+
+# Resume uploading rows left in the outbox by a previous (crashed) process
+server.before_request(outbox.ensure_flusher)
 
 # --- DATA LOADING ---
-# This function is the same as before, but without the Streamlit cache decorator
-def load_user_data():
+# Each study's roster is parsed once per process and cached by username (see
+# roster.py and studies.py)
+def load_user_data(study):
     """
-    Loads user login data from an Excel file.
+    Returns the {username: Panelist} roster mapping of `study`, or None if the file is missing.
     """
-    try:
-        df = pd.read_excel("Thứ tự câu hỏi Mía tăng lực.xlsx")
-        df.columns = ["username", "password", "order"]
-        df['password'] = df['password'].astype(str)
-        return df
-    except FileNotFoundError:
-        # In a Dash app, we handle the error directly in the layout
-        return None
+    return studies.registry.roster(study).panelists()
 
-# --- GOOGLE SHEETS CONNECTION ---
-def connect_to_google_sheets():
+def session_study(session_data):
     """
-    Connects to Google Sheets using a local credentials.json file.
-    NOTE: For production, use environment variables instead of a file.
+    The study of a logged-in session, as recorded server-side at login, or
+    None if there is no session or that study is no longer served.
     """
-    try:
-        # For this version, we read a local file named 'credentials.json'
-        # This file should be in the same directory as your app.py
-        client = gspread.service_account(filename="credentials.json")
-        return client
-    except Exception as e:
-        print(f"Lỗi kết nối Google Sheets: {e}")
+    session = sessions.get(session_data.get('token'))
+    if session is None:
         return None
+    return studies.registry.get(session.data.get('study'))
 
-def append_to_google_sheet(dataframe, sheet_id, client):
+def login_again(session_data):
     """
-    Appends a DataFrame to a specified Google Sheet.
-    Returns True on success, False on failure.
+    Fresh login-view session data for a browser whose server-side session is
+    gone (evicted, server restarted, or held by another worker).
     """
-    if client is None: 
-        print("Không thể ghi vào Google Sheet do kết nối không thành công.")
-        return False
-    try:
-        sheet = client.open_by_key(sheet_id)
-        worksheet = sheet.get_worksheet(0)
-        existing_headers = worksheet.row_values(1)
-        
-        if not existing_headers:
-            set_with_dataframe(worksheet, dataframe)
-            print("Đã lưu kết quả (với header mới) vào Google Sheet thành công!")
-            return True
-
-        # Ensure all columns from the dataframe exist in the sheet, add if they don't
-        new_headers = [h for h in dataframe.columns if h not in existing_headers]
-        if new_headers:
-            last_col = len(existing_headers)
-            worksheet.update(range_name=gspread.utils.rowcol_to_a1(1, last_col + 1), values=[new_headers])
-            existing_headers.extend(new_headers)
-
-        # Fill missing columns in dataframe with None to match sheet headers
-        for header in existing_headers:
-            if header not in dataframe.columns:
-                dataframe[header] = None
-
-        ordered_df = dataframe[existing_headers]
-        values_to_append = ordered_df.values.tolist()
-        worksheet.append_rows(values_to_append, value_input_option='USER_ENTERED')
-        print("Đã lưu kết quả vào Google Sheet thành công!")
-        return True
-    except Exception as e:
-        print(f"Lỗi khi ghi vào Google Sheet: {e}")
-        return False
+    return {'current_view': 'login', 'user': None, 'token': None, 'sample_index': 0,
+            'study': (session_data or {}).get('study')}
+
+def active_session(session_data):
+    """
+    The server-side session of a panelist past the user info form, or None.
+    """
+    session = sessions.get((session_data or {}).get('token'))
+    if session is None or 'user_info' not in session.data:
+        return None
+    return session
 
 # --- APP LAYOUT ---
 # The layout is the structure of your web page.
 # We use dcc.Store to keep track of the app's state between callbacks (like st.session_state)
 app.layout = dbc.Container([
     # Hidden stores to hold session data
+    # Only a small token and the current view live in the browser; the user
+    # info and evaluation results are kept server-side (see sessions.py and
+    # results_store.py)
     dcc.Store(id='session-store', storage_type='session'), # Stores user, view, etc.
-    dcc.Store(id='results-store', storage_type='session'), # Stores evaluation results
+    # The study is selected by the URL: /<study code> or ?study=<study code>
+    dcc.Location(id='url', refresh=False),
 
     # Div to act as a trigger for scrolling
     html.Div(id='scroll-trigger', style={'display': 'none'}),
@@ -112,178 +119,92 @@ app.layout = dbc.Container([
     Output('session-store', 'data'),
     Output('scroll-trigger', 'children'),
     Input('session-store', 'data'),
-    State('results-store', 'data')
+    State('url', 'pathname'),
+    State('url', 'search'),
 )
-def render_page_content(session_data, results_data):
+def render_page_content(session_data, pathname=None, search=None):
     """
     This is the main "router" of the app. It decides which view to show
     based on the 'current_view' value in the session data.
     """
-    # Initialize session data if it's empty
+    # Initialize session data if it's empty, or if the URL now points to
+    # another study than the one this browser tab was taking part in
+    url_study = studies.registry.resolve(pathname, search)
+    if session_data and url_study is not None and session_data.get('study') not in (None, url_study.code):
+        session_data = None
+    if session_data and session_data.get('study') is None and url_study is not None:
+        session_data['study'] = url_study.code
     if not session_data:
         session_data = {
             'current_view': 'login',
             'user': None,
-            'user_info': None,
-            'sample_index': 0
+            'token': None,
+            'sample_index': 0,
+            'study': url_study.code if url_study is not None else None
         }
 
     view = session_data.get('current_view')
+    study = session_study(session_data) or studies.registry.get(session_data.get('study'))
+    if study is None:
+        return layouts.build_study_picker(studies.registry.studies().values()), session_data, no_update
     
-    if not os.path.exists("credentials.json"):
+    if sheets.SHEETS_BACKEND != "stub" and not os.path.exists("credentials.json"):
         return dbc.Alert("Lỗi nghiêm trọng: Không tìm thấy file 'credentials.json'. Vui lòng đảm bảo file này tồn tại trong cùng thư mục với ứng dụng.", color="danger"), no_update, no_update
         
-    user_df = load_user_data()
-    if user_df is None:
-        return dbc.Alert("Lỗi: Không tìm thấy file 'Thứ tự câu hỏi Mía tăng lực.xlsx'. Vui lòng đảm bảo file này tồn tại trong cùng thư mục với ứng dụng.", color="danger"), no_update, no_update
+    if load_user_data(study) is None:
+        return dbc.Alert(f"Lỗi: Không tìm thấy file '{study.roster_file}'. Vui lòng đảm bảo file này tồn tại trong cùng thư mục với ứng dụng.", color="danger"), no_update, no_update
+
+    # The server-side session may be gone (e.g. server restarted): log in again
+    if view != 'login' and sessions.get(session_data.get('token')) is None:
+        session_data = login_again({'study': study.code})
+        view = 'login'
+
+    # The views below are cached templates (see layouts.py); only the
+    # per-panelist header text is patched in on each render.
 
     # --- RENDER LOGIN VIEW ---
     if view == 'login':
-        login_layout = dbc.Row(dbc.Col(dbc.Card([
-            dbc.CardHeader("Đăng nhập"),
-            dbc.CardBody([
-                dbc.Input(id='login-username', placeholder='Tên đăng nhập', type='text', className="mb-3"),
-                dbc.Input(id='login-password', placeholder='Mật khẩu', type='password', className="mb-3"),
-                dbc.Button("Đăng nhập", id='login-button', color='primary', n_clicks=0, className="w-100"),
-                html.Div(id='login-error', className="mt-3")
-            ])
-        ]), width=12, md=6, lg=4), justify="center")
-        return login_layout, session_data, no_update
+        return layouts.login_layout(), session_data, no_update
 
     # --- RENDER USER INFO VIEW ---
     elif view == 'user_info':
-        info_layout = dbc.Card([
-            dbc.CardHeader(f"Thông tin người tham gia (Chào {session_data.get('user')})"),
-            dbc.CardBody([
-                dbc.Row([
-                    dbc.Col(dbc.Input(id='info-name', placeholder='Họ và tên', className="mb-3"), width=12),
-                    dbc.Col(dbc.Select(id='info-gender', options=["Nam", "Nữ", "Khác"], placeholder="Giới tính", className="mb-3"), width=6),
-                    dbc.Col(dbc.Input(id='info-age', placeholder='Tuổi', type='number', min=1, step=1, className="mb-3"), width=6),
-                ]),
-                html.P("Nghề nghiệp của bạn là gì?"),
-                dbc.RadioItems(id='info-occupation', options=["Sinh viên", "Nhân viên văn phòng", "Doanh nhân", "Lao động tự do", "Nghề nghiệp khác"], inline=True, className="mb-3"),
-                html.P("Tần suất sử dụng nước tăng lực đóng lon của bạn?"),
-                dbc.RadioItems(id='info-frequency', options=["6 lần/ tuần", "5 lần/ tuần", "4 lần/ tuần", "3 lần/ tuần", "2 lần/tuần", "1 lần/ tuần", "ít hơn 1 lần/ tuần"], inline=True, className="mb-3"),
-                dbc.Button("Tiếp tục", id='info-button', color='primary', n_clicks=0, className="w-100"),
-                html.Div(id='info-error', className="mt-3")
-            ])
-        ])
-        return info_layout, session_data, datetime.now().isoformat() # Trigger scroll
+        return layouts.user_info_layout(session_data.get('user')), session_data, datetime.now().isoformat() # Trigger scroll
 
     # --- RENDER INSTRUCTIONS VIEW ---
     elif view == 'instructions':
-        instructions_layout = dbc.Card([
-            dbc.CardHeader("Hướng dẫn cảm quan"),
-            dbc.CardBody([
-                html.P("Anh/Chị sẽ được nhận các mẫu nước tăng lực được gán mã số, vui lòng đánh giá lần lượt các mẫu từ trái sang phải theo thứ tự đã cung cấp. Anh/Chị vui lòng đánh giá mỗi mẫu theo trình tự sau:"),
-                html.Ol([
-                    html.Li("Dùng thử sản phẩm và đánh giá cường độ các tính chất MÀU SẮC, MÙI và HƯƠNG VỊ."),
-                    html.Li("Cho biết cường độ của mỗi tính chất mà anh/chị cho là lý tưởng (cường độ mà anh/chị mong muốn cho sản phẩm nước tăng lực này)."),
-                    html.Li("Nếu cường độ tính chất của mẫu phù hợp với mong muốn của anh/chị, vui lòng chọn cường độ lý tưởng bằng với cường độ tính chất của mẫu."),
-                    html.Li("Cho biết độ ưa thích chung đối với mẫu sản phẩm này."),
-                ]),
-                html.P(html.B("LƯU Ý:", style={'color': 'red'})),
-                html.Ul([
-                    html.Li("Anh/chị lưu ý sử dụng nước và bánh để thanh vị trước và sau mỗi mẫu thử."),
-                    html.Li("Anh/chị vui lòng không trao đổi trong quá trình đánh giá mẫu."),
-                    html.Li("Anh/chị vui lòng liên hệ với thực nghiệm viên nếu có bất kì thắc mắc nào trong quá trình đánh giá."),
-                ]),
-                dbc.Button("Bắt đầu đánh giá", id='start-eval-button', color='primary', n_clicks=0, className="mt-3 w-100"),
-            ])
-        ])
-        return instructions_layout, session_data, datetime.now().isoformat() # Trigger scroll
+        return layouts.instructions_layout(), session_data, datetime.now().isoformat() # Trigger scroll
 
     # --- RENDER EVALUATION VIEW ---
     elif view == 'evaluation':
-        user_row = user_df[user_df.username == session_data['user']]
-        user_order_str = user_row["order"].values[0].replace("–", "-")
-        sample_codes = [code.strip() for code in user_order_str.split("-")]
+        sample_codes = studies.registry.roster(study).sample_codes(session_data['user'])
         idx = session_data['sample_index']
 
         if idx >= len(sample_codes):
             session_data['current_view'] = 'ranking'
             return dbc.Spinner(color="primary"), session_data, datetime.now().isoformat()
 
-        sample = sample_codes[idx]
-        attributes = ["Màu sắc", "Hương sản phẩm", "Vị ngọt", "Vị chua", "Vị đắng", "Vị chát", "Hậu vị"]
-        
-        eval_form = [html.H4(f"Đánh giá mẫu: {sample} ({idx + 1}/{len(sample_codes)})")]
-        for attr in attributes:
-            eval_form.extend([
-                html.H5(f"🔸 {attr}", className="mt-4"),
-                dbc.Row([
-                    dbc.Col([html.Label("Cường độ trong mẫu"), dcc.Slider(1, 100, 1, value=50, id={'type': 'slider-sample', 'index': attr}, marks=None, tooltip={"placement": "bottom", "always_visible": True})]),
-                    dbc.Col([html.Label("Cường độ lý tưởng"), dcc.Slider(1, 100, 1, value=50, id={'type': 'slider-ideal', 'index': attr}, marks=None, tooltip={"placement": "bottom", "always_visible": True})]),
-                ]),
-                html.Hr()
-            ])
-        
-        preference_options = [
-            "1 - Cực kỳ không thích", "2 - Rất không thích", "3 - Không thích",
-            "4 - Tương đối không thích", "5 - Không thích cũng không ghét", "6 - Tương đối thích",
-            "7 - Thích", "8 - Rất thích", "9 - Cực kỳ thích"
-        ]
-        eval_form.append(html.Div([
-            html.P("Điểm ưa thích chung"),
-            dbc.RadioItems(id='eval-preference', options=preference_options, className="mb-3")
-        ]))
-        eval_form.append(dbc.Button("Tiếp tục", id='eval-button', color='primary', n_clicks=0, className="w-100"))
-        eval_form.append(html.Div(id='eval-error', className="mt-3"))
-
-        return html.Div(eval_form), session_data, datetime.now().isoformat() # Trigger scroll
+        if EVAL_MODE == 'client':
+            eval_form = layouts.client_evaluation_layout(sample_codes, idx, study.attributes, study.rank_titles)
+        else:
+            eval_form = layouts.evaluation_layout(sample_codes[idx], idx, len(sample_codes), study.attributes)
+        return eval_form, session_data, datetime.now().isoformat() # Trigger scroll
 
     # --- RENDER RANKING VIEW ---
     elif view == 'ranking':
-        user_row = user_df[user_df.username == session_data['user']]
-        user_order_str = user_row["order"].values[0].replace("–", "-")
-        sample_codes = sorted([code.strip() for code in user_order_str.split("-")])
-        rank_titles = ["Ngon nhất", "Thứ hai", "Thứ ba", "Thứ 4", "Thứ 5"]
-        
-        cols = []
-        for i, title in enumerate(rank_titles[:len(sample_codes)]):
-            cols.append(dbc.Col(
-                dbc.Card([
-                    dbc.CardHeader(title),
-                    dbc.CardBody(dcc.Dropdown(sample_codes, id={'type': 'rank-dropdown', 'index': i}))
-                ]),
-                width=12, md=6, lg=2
-            ))
-        
-        ranking_layout = html.Div([
-            html.H4("Thứ hạng các sản phẩm"),
-            html.P("Hãy sắp xếp các sản phẩm theo thứ tự ngon nhất đến kém ngon nhất", className="text-muted"),
-            dbc.Row(cols, className="g-3"),
-            dbc.Button("Xác nhận và Hoàn thành", id='rank-button', color='success', n_clicks=0, className="mt-4 w-100"),
-            html.Div(id='rank-error', className="mt-3")
-        ])
-        return ranking_layout, session_data, datetime.now().isoformat() # Trigger scroll
+        sample_codes = sorted(studies.registry.roster(study).sample_codes(session_data['user']))
+        return layouts.ranking_layout(sample_codes, study.rank_titles), session_data, datetime.now().isoformat() # Trigger scroll
     
     # --- RENDER THANK YOU VIEW ---
     elif view == 'thank_you':
-        # **IMPROVEMENT**: The logic for saving and showing status is now here.
-        
-        # 1. Connect to Google Sheets
-        client = connect_to_google_sheets()
-        save_status_alert = None
-
-        if not client:
-            save_status_alert = dbc.Alert("Lỗi kết nối Google Sheets. Vui lòng kiểm tra file credentials.json.", color="danger")
-        else:
-            # 2. Prepare final data and save
-            df_results = pd.DataFrame(results_data)
-            sheet_id = "13XRlhwoQY-ErLy75l8B0fOv-KyIoO6p_VlzkoUnfUl0"
-            success = append_to_google_sheet(df_results, sheet_id, client)
-            if success:
-                save_status_alert = dbc.Alert("Lưu vào Google Sheet thành công!", color="success")
-            else:
-                save_status_alert = dbc.Alert("Lỗi khi lưu vào Google Sheet. Vui lòng kiểm tra quyền chia sẻ và kết nối.", color="danger")
-
+        # The results were queued for the background flusher together with
+        # the ranking (outbox.submit); this view only shows their sync status.
         thank_you_layout = html.Div([
             dbc.Alert([
                 html.H4("✅ Bạn đã hoàn thành tất cả các mẫu!", className="alert-heading"),
                 html.P("Cảm ơn bạn đã tham gia!"),
             ], color="success"),
-            save_status_alert, # Show the save status here
+            html.Div(save_status_alert(*outbox.status(session_data.get('outbox_id'))), id='save-status'), # Show the save status here
+            dcc.Interval(id='save-status-poll', interval=2000),
             dbc.Button("Tải kết quả về máy", id="download-button", color="info"),
             dcc.Download(id="download-dataframe-xlsx")
         ])
@@ -292,6 +213,43 @@ def render_page_content(session_data, results_data):
     return html.Div("Lỗi: Chế độ xem không xác định."), session_data, no_update
 
 
+def save_status_alert(status, last_error):
+    """
+    Alert describing whether the results are only saved locally or synced.
+    """
+    if status == outbox.SYNCED:
+        return dbc.Alert("Lưu vào Google Sheet thành công!", color="success")
+    if last_error:
+        return dbc.Alert("Đã lưu kết quả trên máy chủ. Đang thử lại đồng bộ lên Google Sheet...", color="warning")
+    return dbc.Alert("Đã lưu kết quả trên máy chủ. Đang đồng bộ lên Google Sheet...", color="info")
+
+
+def resume_session(study, username):
+    """
+    Picks up an evaluation the panelist left halfway (e.g. the tablet's
+    browser crashed): the ratings stored so far are the checkpoint. Returns
+    (token, sample_index) of the resumed session, or None to start afresh.
+    """
+    if RESUME_MAX_AGE_HOURS <= 0:
+        return None
+    since = records.format_timestamp((datetime.now().timestamp() - RESUME_MAX_AGE_HOURS * 3600) * 1000)
+    unfinished = results_store.unfinished_submission(username, study.code, since)
+    if unfinished is None:
+        return None
+    token, rated, last_record = unfinished
+    # Only when the stored samples are the start of the panelist's current order
+    sample_codes = studies.registry.roster(study).sample_codes(username)
+    if rated != sample_codes[:len(rated)]:
+        return None
+    session = sessions.get(token)
+    if session is None or 'user_info' not in session.data:
+        # The session itself is gone (server restart, another worker): the
+        # user info is part of every record
+        sessions.create(token=token, user=username, study=study.code, user_info=records.user_info_of(last_record))
+    metrics.inc("session_resume_total", help="Logins resuming an unfinished evaluation")
+    return token, len(rated)
+
+
 # --- Specific Callbacks for Button Clicks and Logic ---
 
 @callback(
@@ -305,14 +263,21 @@ def render_page_content(session_data, results_data):
 )
 def handle_login(n_clicks, username, password, session_data):
     if not n_clicks: return no_update, ""
-    user_df = load_user_data()
-    if user_df is None: 
+    study = studies.registry.get(session_data.get('study')) or studies.registry.resolve()
+    if study is None or load_user_data(study) is None: 
         return no_update, dbc.Alert("Lỗi file dữ liệu người dùng.", color="danger")
     
-    user_match = user_df[(user_df.username == username) & (user_df.password == str(password))]
-    if not user_match.empty:
-        session_data['current_view'] = 'user_info'
+    if studies.registry.roster(study).authenticate(username, password) is not None:
         session_data['user'] = username
+        session_data['study'] = study.code
+        resumed = resume_session(study, username)
+        if resumed is not None:
+            session_data['token'], session_data['sample_index'] = resumed
+            session_data['current_view'] = 'evaluation'
+            return session_data, ""
+        session_data['current_view'] = 'user_info'
+        session_data['token'] = sessions.create(user=username, study=study.code)
+        session_data['sample_index'] = 0
         return session_data, ""
     else:
         return no_update, dbc.Alert("Sai tên đăng nhập hoặc mật khẩu.", color="danger")
@@ -334,10 +299,11 @@ def handle_user_info(n_clicks, name, gender, age, occ, freq, session_data):
     if not all([name, gender, age, occ, freq]):
         return no_update, dbc.Alert("❌ Vui lòng điền đầy đủ tất cả thông tin.", color="warning")
     
-    session_data['user_info'] = {
+    if sessions.update(session_data['token'], user_info={
         "full_name": name, "gender": gender, "age": age,
         "occupation": occ, "frequency": freq
-    }
+    }) is None:
+        return login_again(session_data), ""
     session_data['current_view'] = 'instructions'
     return session_data, ""
 
@@ -354,7 +320,6 @@ def start_evaluation(n_clicks, session_data):
 
 @callback(
     Output('session-store', 'data', allow_duplicate=True),
-    Output('results-store', 'data'),
     Output('eval-error', 'children'),
     Input('eval-button', 'n_clicks'),
     State({'type': 'slider-sample', 'index': dash.ALL}, 'value'),
@@ -362,90 +327,134 @@ def start_evaluation(n_clicks, session_data):
     State({'type': 'slider-sample', 'index': dash.ALL}, 'id'),
     State('eval-preference', 'value'),
     State('session-store', 'data'),
-    State('results-store', 'data'),
     prevent_initial_call=True
 )
-def handle_evaluation(n_clicks, sample_vals, ideal_vals, attr_ids, preference, session_data, results_data):
-    if not n_clicks: return no_update, no_update, ""
+def handle_evaluation(n_clicks, sample_vals, ideal_vals, attr_ids, preference, session_data):
+    if not n_clicks: return no_update, ""
     if not preference:
-        return no_update, no_update, dbc.Alert("❌ Vui lòng chọn mức độ ưa thích chung.", color="warning")
+        return no_update, dbc.Alert("❌ Vui lòng chọn mức độ ưa thích chung.", color="warning")
     
-    user_df = load_user_data()
-    user_row = user_df[user_df.username == session_data['user']]
-    user_order_str = user_row["order"].values[0].replace("–", "-")
-    sample_codes = [code.strip() for code in user_order_str.split("-")]
+    session = active_session(session_data)
+    study = session_study(session_data)
+    if session is None or study is None:
+        return login_again(session_data), ""
+    sample_codes = studies.registry.roster(study).sample_codes(session_data['user'])
     sample_code = sample_codes[session_data['sample_index']]
 
-    rating = {}
-    for i, attr_id in enumerate(attr_ids):
-        attr_name = attr_id['index']
-        rating[f"{attr_name} - Cường độ mẫu"] = sample_vals[i]
-        rating[f"{attr_name} - Cường độ lý tưởng"] = ideal_vals[i]
-
-    full_record = {
-        "username": session_data['user'],
-        "sample": sample_code,
-        **session_data['user_info'],
-        "timestamp": datetime.now(timezone("Asia/Ho_Chi_Minh")).strftime("%Y-%m-%d %H:%M:%S"),
-        **rating,
-        "Ưa thích chung": int(preference.split(" ")[0])
-    }
+    intensities = {attr_id['index']: (sample_vals[i], ideal_vals[i]) for i, attr_id in enumerate(attr_ids)}
+    full_record = records.sample_record(
+        session_data['user'], session.data['user_info'],
+        sample_code, intensities, records.parse_preference(preference)
+    )
     
-    if results_data is None: results_data = []
-    results_data.append(full_record)
+    results_store.append(session_data['token'], full_record, study=study.code)
     
     session_data['sample_index'] += 1
     
     if session_data['sample_index'] >= len(sample_codes):
         session_data['current_view'] = 'ranking'
 
-    return session_data, results_data, ""
+    return session_data, ""
 
 @callback(
     Output('session-store', 'data', allow_duplicate=True),
-    Output('results-store', 'data', allow_duplicate=True),
     Output('rank-error', 'children'),
     Input('rank-button', 'n_clicks'),
     State({'type': 'rank-dropdown', 'index': dash.ALL}, 'value'),
     State('session-store', 'data'),
-    State('results-store', 'data'),
     prevent_initial_call=True
 )
-def handle_ranking(n_clicks, ranks, session_data, results_data):
-    if not n_clicks: return no_update, no_update, ""
-    if not all(ranks):
-        return no_update, no_update, dbc.Alert("❌ Vui lòng xếp hạng cho tất cả các mục.", color="warning")
-    if len(set(ranks)) != len(ranks):
-        return no_update, no_update, dbc.Alert("❌ Mỗi sản phẩm chỉ được chọn một lần.", color="warning")
-
-    rank_titles = ["Ngon nhất", "Thứ hai", "Thứ ba", "Thứ 4", "Thứ 5"]
-    ranking_data = {f"Thứ hạng - {rank_titles[i]}": rank for i, rank in enumerate(ranks)}
-    
+def handle_ranking(n_clicks, ranks, session_data):
+    if not n_clicks: return no_update, ""
+    error = records.ranking_error(ranks)
+    if error:
+        return no_update, dbc.Alert(error, color="warning")
+
     # Create a separate record for the ranking
-    ranking_record = {
-        "username": session_data['user'],
-        "sample": "Xếp hạng tổng thể", # Use a special value for sample
-        **session_data['user_info'],
-        "timestamp": datetime.now(timezone("Asia/Ho_Chi_Minh")).strftime("%Y-%m-%d %H:%M:%S"),
-        **ranking_data
-    }
+    session = active_session(session_data)
+    study = session_study(session_data)
+    if session is None or study is None:
+        return login_again(session_data), ""
+    ranking_record = records.ranking_record(
+        session_data['user'], session.data['user_info'], ranks, study.rank_titles
+    )
     
-    if results_data is None: results_data = []
-    results_data.append(ranking_record)
-        
+    # Stored and queued for Google Sheets at once; the session token doubles
+    # as submission ID, so a repeated submit is a no-op
+    session_data['outbox_id'] = outbox.submit(session_data['token'], ranking_record,
+                                              study=study.code, sheet_id=study.sheet_id)
+    session_data['current_view'] = 'thank_you'
+    return session_data, ""
+
+@callback(
+    Output('session-store', 'data', allow_duplicate=True),
+    Output('client-rank-error', 'children'),
+    Input('client-rank-button', 'n_clicks'),
+    State({'type': 'rank-dropdown', 'index': dash.ALL}, 'value'),
+    State('eval-ratings', 'data'),
+    State('session-store', 'data'),
+    prevent_initial_call=True
+)
+def handle_batch_submission(n_clicks, ranks, ratings, session_data):
+    """
+    Final submit of the client-side paging mode: all sample ratings collected
+    in the browser plus the ranking, stored as the same records that
+    handle_evaluation and handle_ranking produce.
+    """
+    if not n_clicks: return no_update, ""
+    error = records.ranking_error(ranks)
+    if error:
+        return no_update, dbc.Alert(error, color="warning")
+
+    session = active_session(session_data)
+    study = session_study(session_data)
+    if session is None or study is None:
+        return login_again(session_data), ""
+    sample_codes = studies.registry.roster(study).sample_codes(session_data['user'])
+    start = session_data['sample_index']
+    ratings = ratings or []
+    error = records.ratings_error(ratings, sample_codes[start:], study.attributes)
+    if error:
+        return no_update, dbc.Alert(error, color="danger")
+
+    user_info = session.data['user_info']
+    session_data['outbox_id'] = outbox.submit(session_data['token'], *[
+        records.sample_record(
+            session_data['user'], user_info, rating['sample'],
+            rating['intensities'], rating['preference'],
+            timestamp=records.format_timestamp(rating.get('timestamp'))
+        ) for rating in ratings
+    ], records.ranking_record(session_data['user'], user_info, ranks, study.rank_titles),
+        study=study.code, sheet_id=study.sheet_id)
+
+    session_data['sample_index'] = len(sample_codes)
     session_data['current_view'] = 'thank_you'
-    return session_data, results_data, ""
+    return session_data, ""
+
+@callback(
+    Output('save-status', 'children'),
+    Output('save-status-poll', 'disabled'),
+    Input('save-status-poll', 'n_intervals'),
+    State('session-store', 'data'),
+    prevent_initial_call=True
+)
+def poll_save_status(n_intervals, session_data):
+    if not session_data or session_data.get('outbox_id') is None:
+        return no_update, True
+    status, last_error = outbox.status(session_data['outbox_id'])
+    return save_status_alert(status, last_error), status == outbox.SYNCED
 
 @callback(
     Output("download-dataframe-xlsx", "data"),
     Input("download-button", "n_clicks"),
-    State('results-store', 'data'),
     State('session-store', 'data'),
     prevent_initial_call=True,
 )
-def download_results(n_clicks, results_data, session_data):
+def download_results(n_clicks, session_data):
     if not n_clicks: return no_update
-    df = pd.DataFrame(results_data)
+    import pandas as pd
+
+    df = pd.DataFrame(results_store.submission_records(session_data.get('token')))
     output = io.BytesIO()
     with pd.ExcelWriter(output, engine='openpyxl') as writer:
         df.to_excel(writer, index=False, sheet_name='results')
@@ -472,6 +481,56 @@ app.clientside_callback(
 )
 
 
+# --- CLIENT-SIDE SAMPLE PAGING ---
+# Used by EVAL_MODE=client; the function lives in assets/eval_paging.js.
+app.clientside_callback(
+    dash.ClientsideFunction(namespace='eval_paging', function_name='next'),
+    Output('eval-ratings', 'data'),
+    Output('eval-title', 'children'),
+    Output('client-eval-error', 'children'),
+    Output({'type': 'slider-sample', 'index': dash.ALL}, 'value'),
+    Output({'type': 'slider-ideal', 'index': dash.ALL}, 'value'),
+    Output('eval-preference', 'value'),
+    Output('eval-section', 'style'),
+    Output('ranking-section', 'style'),
+    Input('eval-next-button', 'n_clicks'),
+    State({'type': 'slider-sample', 'index': dash.ALL}, 'value'),
+    State({'type': 'slider-ideal', 'index': dash.ALL}, 'value'),
+    State({'type': 'slider-sample', 'index': dash.ALL}, 'id'),
+    State('eval-preference', 'value'),
+    State('eval-plan', 'data'),
+    State('eval-ratings', 'data'),
+    prevent_initial_call=True
+)
+
+
+# --- WARM-UP ---
+def warm_up():
+    """
+    Loads the rosters of the studies (up to MAX_ACTIVE_STUDIES), renders
+    every view template they need and imports the Sheets client. Called by
+    gunicorn in the master process when the app is preloaded (see
+    gunicorn.conf.py), so forked workers share all of it copy-on-write and
+    start serving without any first-request cost.
+    """
+    import gspread  # noqa: F401
+    import gspread_dataframe  # noqa: F401
+
+    layouts.login_layout()
+    layouts.user_info_layout("")
+    layouts.instructions_layout()
+    total = 0
+    for study in list(studies.registry.studies().values())[:studies.MAX_ACTIVE_STUDIES]:
+        panelists = load_user_data(study) or {}
+        total += len(panelists)
+        layouts.evaluation_layout("", 0, 0, study.attributes)
+        for sample_codes in {panelist.sample_codes for panelist in panelists.values()}:
+            layouts.ranking_layout(sorted(sample_codes), study.rank_titles)
+            if EVAL_MODE == 'client':
+                layouts.client_evaluation_layout(sample_codes, 0, study.attributes, study.rank_titles)
+    return total
+
+
 # --- RUN THE APP ---
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,45 @@
+// Client-side sample paging (EVAL_MODE=client).
+// Moves through the samples of 'eval-plan' without a server round trip:
+// validates the overall liking score, stores the sample's ratings in
+// 'eval-ratings', resets the form for the next sample and finally shows the
+// ranking section. The server only receives the batch on the final submit.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    eval_paging: {
+        next: function (n_clicks, sampleVals, idealVals, attrIds, preference, plan, ratings) {
+            var nu = window.dash_clientside.no_update;
+            if (!n_clicks || !plan) {
+                return [nu, nu, nu, nu, nu, nu, nu, nu];
+            }
+            if (!preference) {
+                var alert = {
+                    type: 'Alert',
+                    namespace: 'dash_bootstrap_components',
+                    props: {children: '❌ Vui lòng chọn mức độ ưa thích chung.', color: 'warning'}
+                };
+                return [nu, nu, alert, nu, nu, nu, nu, nu];
+            }
+
+            ratings = (ratings || []).slice();
+            var idx = plan.start + ratings.length;
+            var intensities = {};
+            attrIds.forEach(function (attrId, i) {
+                intensities[attrId.index] = [sampleVals[i], idealVals[i]];
+            });
+            ratings.push({
+                sample: plan.samples[idx],
+                intensities: intensities,
+                preference: parseInt(preference.split(' ')[0], 10),
+                timestamp: Date.now()
+            });
+
+            window.scrollTo({top: 0, behavior: 'smooth'});
+            idx += 1;
+            var resetSliders = attrIds.map(function () { return 50; });
+            if (idx >= plan.samples.length) {
+                return [ratings, nu, '', nu, nu, nu, {display: 'none'}, {}];
+            }
+            var title = 'Đánh giá mẫu: ' + plan.samples[idx] + ' (' + (idx + 1) + '/' + plan.samples.length + ')';
+            return [ratings, title, '', resetSliders, resetSliders, null, nu, nu];
+        }
+    }
+});
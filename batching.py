@@ -0,0 +1,107 @@
+import os
+import threading
+import time
+
+import metrics
+import sheets
+
+# --- BATCHED SHEET WRITES ---
+# During a group tasting many sessions finish within the same minute. Rather
+# than one header read + one append_rows per session, the outbox flusher
+# collects every session that finished within BATCH_WINDOW seconds (or until
+# BATCH_MAX_ROWS rows are waiting) and writes them with a single
+# append_to_google_sheet call, which reconciles headers once per batch.
+
+BATCH_WINDOW = float(os.environ.get("BATCH_WINDOW", "2"))
+BATCH_MAX_ROWS = int(os.environ.get("BATCH_MAX_ROWS", "500"))
+
+
+class BatchStats:
+    """
+    Counters describing the batches written so far in this process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.failed_batches = 0
+        self.sessions = 0
+        self.rows = 0
+        self.last_batch_rows = 0
+        self.max_batch_rows = 0
+        self.last_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+
+    def record(self, sessions, rows, seconds, success):
+        with self._lock:
+            if success:
+                self.batches += 1
+                self.sessions += sessions
+                self.rows += rows
+                self.last_batch_rows = rows
+                self.max_batch_rows = max(self.max_batch_rows, rows)
+            else:
+                self.failed_batches += 1
+            self.last_flush_seconds = seconds
+            self.total_flush_seconds += seconds
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "failed_batches": self.failed_batches,
+                "sessions": self.sessions,
+                "rows": self.rows,
+                "last_batch_rows": self.last_batch_rows,
+                "max_batch_rows": self.max_batch_rows,
+                "mean_batch_rows": self.rows / self.batches if self.batches else 0.0,
+                "last_flush_seconds": self.last_flush_seconds,
+                "total_flush_seconds": self.total_flush_seconds,
+            }
+
+
+stats = BatchStats()
+
+
+def _collect():
+    snapshot = stats.snapshot()
+    yield "sheets_batches_total", "counter", "Batches written to Google Sheets", {}, snapshot["batches"]
+    yield "sheets_batch_failures_total", "counter", "Batches that failed to write", {}, snapshot["failed_batches"]
+    yield "sheets_batch_rows_total", "counter", "Rows written to Google Sheets in batches", {}, snapshot["rows"]
+    yield "sheets_batch_last_rows", "gauge", "Rows in the last batch", {}, snapshot["last_batch_rows"]
+    yield "sheets_batch_last_flush_seconds", "gauge", "Duration of the last batch write", {}, snapshot["last_flush_seconds"]
+
+
+metrics.register_collector(_collect)
+
+
+def coalesce(record_lists):
+    """
+    Merges the records of several sessions into one DataFrame whose columns
+    are the union of all keys, in order of first appearance.
+    """
+    import pandas as pd
+
+    columns = {}
+    rows = []
+    for records in record_lists:
+        for record in records:
+            columns.update(dict.fromkeys(record))
+            rows.append(record)
+    return pd.DataFrame(rows, columns=list(columns))
+
+
+def write_batch(record_lists, sheet_id, client):
+    """
+    Writes the records of several sessions with a single append.
+    Returns True on success, False on failure.
+    """
+    dataframe = coalesce(record_lists)
+    if dataframe.empty:
+        return True
+    start = time.perf_counter()
+    success = sheets.append_to_google_sheet(dataframe, sheet_id, client)
+    seconds = time.perf_counter() - start
+    stats.record(len(record_lists), len(dataframe), seconds, success)
+    metrics.observe("sheets_batch_flush_seconds", seconds, help="Duration of batched Sheets writes")
+    return success
@@ -0,0 +1,116 @@
+"""
+Benchmark: cost of the per-sample checkpoint. Each handle_evaluation call
+commits its rating to the local results store (SQLite, WAL) before
+answering, which is what lets a panelist resume after a browser crash. This
+times that write on its own, the whole handle_evaluation request with and
+without it (the write replaced by a no-op), and the lookup handle_login does
+to find an unfinished session, on a store already holding --existing ratings.
+
+    python benchmarks/bench_checkpoint.py [--existing 20000] [--calls 2000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from loadtest import DashDriver, Transport, percentile  # noqa: E402
+
+
+def report(name, seconds):
+    print(f"  {name:<34}{percentile(seconds, 50) * 1000:9.3f}{percentile(seconds, 95) * 1000:9.3f}"
+          f"{percentile(seconds, 99) * 1000:9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--existing", type=int, default=20000, help="ratings already in the store")
+    parser.add_argument("--calls", type=int, default=2000, help="timed calls per case")
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="bench-checkpoint-")
+    os.environ["SHEETS_BACKEND"] = "stub"
+    os.environ["METRICS_LOG"] = "0"
+    import app
+    import layouts
+    import records
+    import results_store
+    import studies
+
+    study = studies.registry.resolve()
+    panelists = list(studies.registry.roster(study).panelists().values())
+    user_info = {"full_name": "Bench", "gender": "Nam", "age": 30, "occupation": "Sinh viên", "frequency": "1 lần/ tuần"}
+    intensities = {attr: (40, 50) for attr in study.attributes}
+
+    def rating(panelist, sample):
+        return records.sample_record(panelist.username, user_info, sample, intensities, 7)
+
+    # Existing data: every panelist with finished and unfinished submissions
+    for i in range(args.existing):
+        panelist = panelists[i % len(panelists)]
+        results_store.append(f"old-{i // 4}", rating(panelist, panelist.sample_codes[i % len(panelist.sample_codes)]), study=study.code)
+
+    print(f"{args.existing} ratings in the store, {args.calls} calls per case")
+    print(f"  {'':<34}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+
+    seconds = []
+    for i in range(args.calls):
+        record = rating(panelists[i % len(panelists)], "456")
+        start = time.perf_counter()
+        results_store.append(f"bench-{i}", record, study=study.code)
+        seconds.append(time.perf_counter() - start)
+    report("checkpoint write (append)", seconds)
+
+    seconds = []
+    for i in range(args.calls):
+        start = time.perf_counter()
+        results_store.unfinished_submission(panelists[i % len(panelists)].username, study.code)
+        seconds.append(time.perf_counter() - start)
+    report("resume lookup at login", seconds)
+
+    # The whole callback over HTTP; a new session each time, since a sample
+    # already stored for a submission is not written again
+    driver = DashDriver(Transport())
+    panelist = panelists[0]
+    values = {
+        "eval-button": 1,
+        "slider-sample": [(attr, 40) for attr in layouts.ATTRIBUTES],
+        "slider-ideal": [(attr, 50) for attr in layouts.ATTRIBUTES],
+        "eval-preference": "7 - Thích",
+    }
+
+    def callback_times(calls):
+        seconds = []
+        for _ in range(calls):
+            token = app.sessions.create(user=panelist.username, study=study.code, user_info=user_info)
+            values["session-store"] = {"current_view": "evaluation", "user": panelist.username, "token": token,
+                                       "sample_index": 0, "study": study.code}
+            start = time.perf_counter()
+            status, _, _, _ = driver.call("handle_evaluation", values)
+            seconds.append(time.perf_counter() - start)
+            assert status == 200
+        return seconds
+
+    callback_times(200)  # warm-up
+    # Alternating rounds, so drift (WAL growth, caches) hits both cases alike
+    with_checkpoint, without_checkpoint = [], []
+    append = results_store.append
+    for _ in range(10):
+        with_checkpoint += callback_times(args.calls // 10)
+        results_store.append = lambda *records, study=None: None
+        try:
+            without_checkpoint += callback_times(args.calls // 10)
+        finally:
+            results_store.append = append
+    report("handle_evaluation", with_checkpoint)
+    report("handle_evaluation, no checkpoint", without_checkpoint)
+    added = percentile(with_checkpoint, 50) - percentile(without_checkpoint, 50)
+    print(f"  checkpoint adds {added * 1000:.3f} ms to the median callback")
+
+
+if __name__ == "__main__":
+    main()
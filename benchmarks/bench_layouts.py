@@ -0,0 +1,53 @@
+"""
+Micro-benchmark: cost of rendering + serializing the views, rebuilding the
+component tree on every call (before) vs. patching the cached templates
+from layouts.py (after).
+
+    python benchmarks/bench_layouts.py [--repeat N]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from plotly.io.json import to_json_plotly  # noqa: E402
+
+import layouts  # noqa: E402
+
+SAMPLES = ["456", "109", "897", "247"]
+
+CASES = {
+    "evaluation": (
+        lambda: layouts.build_evaluation("897", 2, len(SAMPLES)),
+        lambda: layouts.evaluation_layout("897", 2, len(SAMPLES)),
+    ),
+    "user_info": (
+        lambda: layouts.build_user_info("MTL001"),
+        lambda: layouts.user_info_layout("MTL001"),
+    ),
+    "instructions": (layouts.build_instructions, layouts.instructions_layout),
+    "ranking": (
+        lambda: layouts.build_ranking(sorted(SAMPLES)),
+        lambda: layouts.ranking_layout(sorted(SAMPLES)),
+    ),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'view':<14}{'before (µs)':>14}{'after (µs)':>14}{'speedup':>10}")
+    for name, (before, after) in CASES.items():
+        # Both paths must produce exactly what Dash sends to the browser
+        assert to_json_plotly(before()) == to_json_plotly(after()), name
+        t_before = timeit.timeit(lambda: to_json_plotly(before()), number=args.repeat) / args.repeat
+        t_after = timeit.timeit(lambda: to_json_plotly(after()), number=args.repeat) / args.repeat
+        print(f"{name:<14}{t_before * 1e6:>14.1f}{t_after * 1e6:>14.1f}{t_before / t_after:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
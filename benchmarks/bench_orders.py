@@ -0,0 +1,71 @@
+"""
+Benchmark: serving orders for a large panel. Generating the balanced
+Williams design for every panelist in one vectorized pass (orders.py) vs.
+the workbook path, where each panelist's order is a "A – B – C" string that
+is built by hand and split again at load time (roster.split_order). Also
+checks that the generated orders are balanced (positions, carry-over and,
+with --per-panelist, the pairs each panelist tastes together).
+
+    python benchmarks/bench_orders.py [--panelists 10000] [--samples 6] [--per-panelist K]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import numpy as np  # noqa: E402
+
+import orders  # noqa: E402
+from roster import split_order  # noqa: E402
+
+
+def string_orders(n_panelists, codes):
+    # What the roster workbook holds today: one joined string per panelist
+    n = len(codes)
+    return [" – ".join(codes[(i + j) % n] for j in range(n)) for i in range(n_panelists)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--panelists", type=int, default=10000)
+    parser.add_argument("--samples", type=int, default=6)
+    parser.add_argument("--per-panelist", type=int, default=None)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    codes = [str(100 + 37 * i) for i in range(args.samples)]
+    strings = string_orders(args.panelists, codes)
+
+    cases = {
+        "split order strings": lambda: [split_order(s) for s in strings],
+        "generate int orders": lambda: orders.presentation_orders(args.panelists, args.samples, args.per_panelist, seed=1),
+        "generate + map to codes": lambda: orders.sample_codes(
+            orders.presentation_orders(args.panelists, args.samples, args.per_panelist, seed=1), codes),
+    }
+    print(f"{args.panelists} panelists, {args.samples} samples"
+          + (f", {args.per_panelist} per panelist" if args.per_panelist else ""))
+    for name, function in cases.items():
+        seconds = min(timeit.repeat(function, number=1, repeat=args.repeat))
+        print(f"  {name:<26}{seconds * 1000:9.2f} ms")
+
+    result = orders.presentation_orders(args.panelists, args.samples, args.per_panelist, seed=1)
+    k = result.shape[1]
+    positions = np.zeros((args.samples, k), dtype=int)
+    np.add.at(positions, (result, np.broadcast_to(np.arange(k), result.shape)), 1)
+    carry_over = np.zeros((args.samples, args.samples), dtype=int)
+    np.add.at(carry_over, (result[:, :-1], result[:, 1:]), 1)
+    off_diagonal = carry_over[~np.eye(args.samples, dtype=bool)]
+    together = np.zeros((args.samples, args.samples), dtype=int)
+    for a in range(k):
+        for b in range(a + 1, k):
+            np.add.at(together, (result[:, a], result[:, b]), 1)
+    together = (together + together.T)[~np.eye(args.samples, dtype=bool)]
+    print(f"  sample x position counts   {positions.min()}..{positions.max()}")
+    print(f"  carry-over pair counts     {off_diagonal.min()}..{off_diagonal.max()}")
+    print(f"  same-panelist pair counts  {together.min()}..{together.max()}")
+
+
+if __name__ == "__main__":
+    main()
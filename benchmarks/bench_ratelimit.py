@@ -0,0 +1,81 @@
+"""
+Rate limiter check: several worker processes append to the local Sheets stub
+(sheets_stub.py) through sheets.append_to_google_sheet while the stub injects
+429 quota errors. Reports how many appends succeeded, how many calls were
+retried, and the API call rate actually reached against the configured
+SHEETS_RATE_PER_MINUTE shared by all processes.
+
+    python benchmarks/bench_ratelimit.py --workers 4 --appends 10 --quota-error-rate 0.2
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+
+def worker(index, appends, results):
+    import pandas as pd
+
+    import sheets
+    import sheets_stub
+
+    client = sheets_stub.client_from_env()
+    attempts = 0
+    api_call = client.api_call
+
+    def counted(name):
+        nonlocal attempts
+        attempts += 1
+        return api_call(name)
+
+    client.api_call = counted
+    ok = 0
+    for i in range(appends):
+        frame = pd.DataFrame([{"username": f"w{index}", "sample": str(i), "Ưa thích chung": 7}])
+        ok += sheets.append_to_google_sheet(frame, sheets.SHEET_ID, client)
+    results.put((ok, attempts, client.errors))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--appends", type=int, default=10, help="appends per worker")
+    parser.add_argument("--rate", type=float, default=120, help="SHEETS_RATE_PER_MINUTE")
+    parser.add_argument("--burst", type=float, default=5, help="SHEETS_RATE_BURST")
+    parser.add_argument("--quota-error-rate", type=float, default=0.2)
+    args = parser.parse_args()
+
+    os.environ.update({
+        "SHEETS_BACKEND": "stub",
+        "DATA_DIR": tempfile.mkdtemp(prefix="ratelimit-"),
+        "SHEETS_RATE_PER_MINUTE": str(args.rate),
+        "SHEETS_RATE_BURST": str(args.burst),
+        "SHEETS_STUB_QUOTA_ERROR_RATE": str(args.quota_error_rate),
+        "METRICS_LOG": "0",
+    })
+
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=worker, args=(i, args.appends, results)) for i in range(args.workers)]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    seconds = time.perf_counter() - start
+
+    ok, calls, errors = (sum(values) for values in zip(*collected))
+    total = args.workers * args.appends
+    print(f"appends      {ok}/{total} succeeded in {seconds:.1f}s")
+    print(f"api calls    {calls} ({errors} injected 429s, retried)")
+    # The bucket starts full, so the first `burst` calls are free
+    print(f"call rate    {(calls - args.burst) / seconds * 60:.0f}/min (limit {args.rate:.0f}/min)")
+
+
+if __name__ == "__main__":
+    main()
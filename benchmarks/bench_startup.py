@@ -0,0 +1,117 @@
+"""
+Start-up benchmark: how long a fresh process takes to import the app, with
+the heavy Sheets/Excel dependencies imported up front (as app.py used to do)
+vs. loaded lazily on first use, and, with and without --preload, how
+long gunicorn takes to serve its first page and how much memory its workers
+use (PSS, which counts pages shared with the master only partly).
+
+    python benchmarks/bench_startup.py [--repeat 5] [--workers 4] [--no-gunicorn]
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+EAGER = "import pandas, gspread, gspread_dataframe, openpyxl, numpy; import app"
+LAZY = "import app"
+
+
+def time_import(code, repeat, env):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, check=True)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def workers_pss(pid):
+    """
+    Total proportional set size (MB) of the children of `pid` (Linux only):
+    memory shared copy-on-write with the master counts only partly.
+    """
+    total = 0
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        children = f.read().split()
+    for child in children:
+        with open(f"/proc/{child}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    total += int(line.split()[1])
+    return total / 1024, len(children)
+
+
+def time_gunicorn(workers, preload, env, requests=200):
+    """
+    Launches gunicorn, returns the seconds until the first page was served
+    and the workers' total PSS after `requests` more page loads.
+    """
+    port = free_port()
+    env = dict(env, GUNICORN_PRELOAD="1" if preload else "0", WEB_CONCURRENCY=str(workers),
+               GUNICORN_THREADS="1", GUNICORN_BIND=f"127.0.0.1:{port}")
+    url = f"http://127.0.0.1:{port}/_dash-layout"
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-m", "gunicorn", "app:server"], cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            if time.perf_counter() - start > 120:
+                raise RuntimeError("gunicorn did not start")
+            try:
+                with urllib.request.urlopen(url, timeout=5) as response:
+                    response.read()
+                break
+            except OSError:
+                time.sleep(0.02)
+        first = time.perf_counter() - start
+        for _ in range(requests):
+            with urllib.request.urlopen(url, timeout=5) as response:
+                response.read()
+        try:
+            pss, children = workers_pss(process.pid)
+        except OSError:
+            pss, children = None, workers
+        return first, pss, children
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--no-gunicorn", action="store_true")
+    args = parser.parse_args()
+
+    env = dict(os.environ, SHEETS_BACKEND="stub", METRICS_LOG="0",
+               DATA_DIR=tempfile.mkdtemp(prefix="startup-"))
+
+    eager = time_import(EAGER, args.repeat, env)
+    lazy = time_import(LAZY, args.repeat, env)
+    print(f"import app (eager deps)   {eager * 1000:8.0f} ms")
+    print(f"import app (lazy deps)    {lazy * 1000:8.0f} ms   ({eager / lazy:.1f}x)")
+
+    if not args.no_gunicorn:
+        for preload in (False, True):
+            first, pss, children = time_gunicorn(args.workers, preload, env)
+            label = "preload" if preload else "no preload"
+            memory = f"{pss:6.0f} MB PSS ({children} workers)" if pss is not None else "PSS n/a"
+            print(f"gunicorn, {label:<10}      {first * 1000:8.0f} ms to first page, {memory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+"""
+Load test: simulates concurrent panelists going through the whole flow
+(login -> user_info -> instructions -> evaluation x N -> ranking -> thank_you)
+against the real Dash endpoints (/_dash-layout, /_dash-update-component).
+
+By default the app runs in-process behind the Flask test client, with Google
+Sheets replaced by the local stub (sheets_stub.py) and a throw-away data
+directory. With --url the same scenario drives a running server instead,
+e.g. a local gunicorn started with SHEETS_BACKEND=stub.
+
+Reports p50/p95/p99 latency per callback and throughput, and writes the
+results as JSON (--json) so runs can be compared.
+
+    python benchmarks/loadtest.py --users 200 --concurrency 20
+    python benchmarks/loadtest.py --users 200 --sheets-latency 0.5 --quota-error-rate 0.1 --json run.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+# Callbacks are identified by the id of their triggering input
+TRIGGERS = {
+    "session-store": "render_page_content",
+    "login-button": "handle_login",
+    "info-button": "handle_user_info",
+    "start-eval-button": "start_evaluation",
+    "eval-button": "handle_evaluation",
+    "rank-button": "handle_ranking",
+    "client-rank-button": "handle_batch_submission",
+    "save-status-poll": "poll_save_status",
+}
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    k = (len(values) - 1) * q / 100
+    lo, hi = int(k), min(int(k) + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+class Transport:
+    """
+    Sends HTTP requests either to the in-process Flask app or to a URL.
+    """
+
+    def __init__(self, url=None):
+        self.url = url.rstrip("/") if url else None
+        self._local = threading.local()
+
+    def _client(self):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            if self.url:
+                import requests
+                client = requests.Session()
+            else:
+                import app
+                client = app.server.test_client()
+            self._local.client = client
+        return client
+
+    def get(self, path):
+        if self.url:
+            response = self._client().get(self.url + path)
+            return response.status_code, response.json()
+        response = self._client().get(path)
+        return response.status_code, response.get_json()
+
+    def post(self, path, body):
+        if self.url:
+            response = self._client().post(self.url + path, json=body)
+            return response.status_code, (response.json() if response.content else None), len(response.content)
+        response = self._client().post(path, json=body)
+        return response.status_code, response.get_json(silent=True), len(response.data)
+
+
+class DashDriver:
+    """
+    Builds /_dash-update-component requests from /_dash-dependencies, the
+    same way the Dash renderer does.
+    """
+
+    def __init__(self, transport):
+        self.transport = transport
+        _, dependencies = transport.get("/_dash-dependencies")
+        self.callbacks = {}
+        for dep in dependencies:
+            if dep.get("clientside_function"):
+                continue
+            trigger = dep["inputs"][0]["id"]
+            name = TRIGGERS.get(trigger if isinstance(trigger, str) else None)
+            if name:
+                self.callbacks[name] = dep
+
+    @staticmethod
+    def _outputs(output):
+        def parse(spec):
+            component_id, prop = spec.rsplit(".", 1)
+            return {"id": component_id, "property": prop}
+        # Multi-output callbacks are keyed "..a.prop...b.prop.." and get a list
+        if output.startswith(".."):
+            return [parse(spec) for spec in output[2:-2].split("...")]
+        return parse(output)
+
+    @staticmethod
+    def _value(spec, values):
+        component_id, prop = spec["id"], spec["property"]
+        if isinstance(component_id, str) and component_id.startswith("{"):
+            component_id = json.loads(component_id)
+        if isinstance(component_id, dict):
+            # Pattern-matching (ALL) dependency: one entry per matched component
+            items = values.get(component_id["type"], [])
+            return [
+                {"id": {**component_id, "index": index}, "property": prop,
+                 "value": {**component_id, "index": index} if prop == "id" else value}
+                for index, value in items
+            ]
+        return {"id": component_id, "property": prop, "value": values.get(component_id)}
+
+    def call(self, name, values):
+        """
+        Invokes callback `name`; `values` maps component ids (or pattern
+        types) to the values of the property each dependency reads.
+        Returns (status, response payload, request bytes, response bytes).
+        """
+        dep = self.callbacks[name]
+        body = {
+            "output": dep["output"],
+            "outputs": self._outputs(dep["output"]),
+            "inputs": [self._value(spec, values) for spec in dep["inputs"]],
+            "state": [self._value(spec, values) for spec in dep.get("state", [])],
+            "changedPropIds": [f'{dep["inputs"][0]["id"]}.{dep["inputs"][0]["property"]}'],
+        }
+        request_bytes = len(json.dumps(body))
+        status, payload, response_bytes = self.transport.post("/_dash-update-component", body)
+        return status, (payload or {}).get("response", {}), request_bytes, response_bytes
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.bytes_in = {}
+        self.bytes_out = {}
+
+    def record(self, name, seconds, ok, request_bytes=0, response_bytes=0):
+        with self._lock:
+            self.latencies.setdefault(name, []).append(seconds)
+            self.bytes_in[name] = self.bytes_in.get(name, 0) + request_bytes
+            self.bytes_out[name] = self.bytes_out.get(name, 0) + response_bytes
+            if not ok:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+
+def session_from(response, fallback):
+    store = response.get("session-store") or {}
+    return store.get("data", fallback)
+
+
+def run_user(driver, recorder, username, password, mode):
+    def call(name, values):
+        start = time.perf_counter()
+        status, response, request_bytes, response_bytes = driver.call(name, values)
+        recorder.record(name, time.perf_counter() - start, status == 200, request_bytes, response_bytes)
+        if status != 200:
+            raise RuntimeError(f"{name} -> HTTP {status}")
+        return response
+
+    start = time.perf_counter()
+    status, _ = driver.transport.get("/_dash-layout")
+    recorder.record("_dash-layout", time.perf_counter() - start, status == 200)
+
+    session = session_from(call("render_page_content", {"session-store": None}), None)
+    session = session_from(call("handle_login", {
+        "login-button": 1, "login-username": username, "login-password": password, "session-store": session,
+    }), session)
+    if session.get("current_view") != "user_info":
+        raise RuntimeError(f"login failed for {username}")
+    call("render_page_content", {"session-store": session})
+    session = session_from(call("handle_user_info", {
+        "info-button": 1, "info-name": f"Load test {username}", "info-gender": "Nam", "info-age": 30,
+        "info-occupation": "Sinh viên", "info-frequency": "1 lần/ tuần", "session-store": session,
+    }), session)
+    call("render_page_content", {"session-store": session})
+    session = session_from(call("start_evaluation", {"start-eval-button": 1, "session-store": session}), session)
+
+    samples = []
+    if mode == "client":
+        page = call("render_page_content", {"session-store": session})["page-content"]["children"]
+        plan = page["props"]["children"][0]["props"]["data"]
+        samples = plan["samples"][plan["start"]:]
+        ratings = [{
+            "sample": sample,
+            "intensities": {attr: [40 + i, 50] for i, attr in enumerate(plan["attributes"])},
+            "preference": 7,
+            "timestamp": int(time.time() * 1000),
+        } for sample in samples]
+        session = session_from(call("handle_batch_submission", {
+            "client-rank-button": 1, "rank-dropdown": list(enumerate(sorted(plan["samples"]))),
+            "eval-ratings": ratings, "session-store": session,
+        }), session)
+    else:
+        while session.get("current_view") == "evaluation":
+            page = call("render_page_content", {"session-store": session})
+            session = session_from(page, session)
+            if session.get("current_view") != "evaluation":
+                break
+            form = page["page-content"]["children"]["props"]["children"]
+            title = form[0]["props"]["children"]
+            samples.append(title.split(": ")[1].split(" (")[0])
+            attributes = [node["props"]["children"][2:] for node in form if node.get("type") == "H5"]
+            session = session_from(call("handle_evaluation", {
+                "eval-button": 1,
+                "slider-sample": [(attr, 40 + i) for i, attr in enumerate(attributes)],
+                "slider-ideal": [(attr, 50) for attr in attributes],
+                "eval-preference": "7 - Thích", "session-store": session,
+            }), session)
+        call("render_page_content", {"session-store": session})
+        session = session_from(call("handle_ranking", {
+            "rank-button": 1, "rank-dropdown": list(enumerate(sorted(samples))), "session-store": session,
+        }), session)
+
+    call("render_page_content", {"session-store": session})
+    call("poll_save_status", {"save-status-poll": 1, "session-store": session})
+    return len(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate concurrent panelists against the Dash callbacks.")
+    parser.add_argument("--users", type=int, default=200, help="number of virtual panelists")
+    parser.add_argument("--concurrency", type=int, default=20, help="panelists active at the same time")
+    parser.add_argument("--mode", choices=["server", "client"], default="server", help="EVAL_MODE to exercise")
+    parser.add_argument("--url", help="drive a running server instead of the in-process app")
+    parser.add_argument("--sheets-latency", type=float, default=0.2, help="seconds per stubbed Sheets API call")
+    parser.add_argument("--quota-error-rate", type=float, default=0.0, help="fraction of Sheets calls failing with 429")
+    parser.add_argument("--drain-timeout", type=float, default=60, help="seconds to wait for the outbox to drain")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    if not args.url:
+        # Configure the in-process app before importing it
+        os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="loadtest-"))
+        os.environ["SHEETS_BACKEND"] = "stub"
+        os.environ["SHEETS_STUB_LATENCY"] = str(args.sheets_latency)
+        os.environ["SHEETS_STUB_QUOTA_ERROR_RATE"] = str(args.quota_error_rate)
+        os.environ["EVAL_MODE"] = args.mode
+
+    transport = Transport(args.url)
+    driver = DashDriver(transport)
+    import studies
+    panelists = list(studies.registry.roster(studies.registry.resolve()).panelists().values())
+
+    recorder = Recorder()
+    failures = []
+
+    def one_user(i):
+        panelist = panelists[i % len(panelists)]
+        try:
+            return run_user(driver, recorder, panelist.username, panelist.password, args.mode)
+        except Exception as e:
+            failures.append(f"{panelist.username}: {e}")
+            return 0
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        samples = sum(pool.map(one_user, range(args.users)))
+    wall = time.perf_counter() - start
+
+    drain = None
+    if not args.url:
+        import outbox
+        drain_start = time.perf_counter()
+        while outbox.pending_count() and time.perf_counter() - drain_start < args.drain_timeout:
+            time.sleep(0.1)
+        drain = {"seconds": time.perf_counter() - drain_start, "pending": outbox.pending_count()}
+
+    callbacks = {}
+    for name, latencies in sorted(recorder.latencies.items()):
+        callbacks[name] = {
+            "count": len(latencies),
+            "errors": recorder.errors.get(name, 0),
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "mean_request_bytes": recorder.bytes_in[name] / len(latencies),
+            "mean_response_bytes": recorder.bytes_out[name] / len(latencies),
+        }
+    total_calls = sum(c["count"] for c in callbacks.values())
+    result = {
+        "config": vars(args),
+        "wall_seconds": wall,
+        "users": args.users,
+        "completed_users": args.users - len(failures),
+        "samples_evaluated": samples,
+        "requests": total_calls,
+        "requests_per_second": total_calls / wall,
+        "sessions_per_second": (args.users - len(failures)) / wall,
+        "callbacks": callbacks,
+        "outbox_drain": drain,
+        "failures": failures[:20],
+    }
+
+    print(f"{args.users} users ({len(failures)} failed), concurrency {args.concurrency}, mode {args.mode}: "
+          f"{wall:.2f}s, {result['requests_per_second']:.1f} req/s, {result['sessions_per_second']:.2f} sessions/s")
+    print(f"{'callback':<26}{'count':>7}{'err':>5}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'resp B':>9}")
+    for name, c in callbacks.items():
+        print(f"{name:<26}{c['count']:>7}{c['errors']:>5}{c['p50_ms']:>9.1f}{c['p95_ms']:>9.1f}{c['p99_ms']:>9.1f}"
+              f"{c['mean_response_bytes']:>9.0f}")
+    if drain:
+        print(f"outbox drained in {drain['seconds']:.2f}s ({drain['pending']} entries still pending)")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
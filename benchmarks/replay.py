@@ -0,0 +1,275 @@
+"""
+Replay: re-drives callback traces recorded with TRACE_DIR (see tracing.py)
+through the in-process app under a profiler, to find the hot spots of real
+traffic. Google Sheets is replaced by the local stub (sheets_stub.py) and
+the data goes to a throw-away directory, so nothing leaves the machine.
+
+Requests are sent at their recorded pace (--speed 1), faster (--speed 10) or
+back to back in one thread (--speed 0); the requests of one session always
+stay in order. Sessions are re-created by their recorded logins (passwords
+come from the current roster), so run the replay against the same
+studies.json and roster workbooks as the recording.
+
+    python benchmarks/replay.py traces/ --speed 0 --profile cprofile --output replay.prof
+    python benchmarks/replay.py traces/trace-*.jsonl.gz --speed 5 --profile sample --output replay.folded
+
+--profile cprofile writes pstats data (snakeviz, `python -m pstats`);
+--profile sample writes collapsed stacks (flamegraph.pl, speedscope).
+"""
+import argparse
+import cProfile
+import glob
+import io
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import tracing  # noqa: E402
+from loadtest import percentile  # noqa: E402
+
+
+def trace_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "*.jsonl.gz"))))
+        else:
+            files.append(path)
+    return files
+
+
+def swap_tokens(value, tokens):
+    """
+    Replaces recorded session tokens in a request body by the ones the
+    replayed logins handed out.
+    """
+    if isinstance(value, dict):
+        return {
+            key: tokens.get(item, item) if key == "token" and isinstance(item, str) else swap_tokens(item, tokens)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [swap_tokens(item, tokens) for item in value]
+    return value
+
+
+class Sampler(threading.Thread):
+    """
+    Sampling profiler: every `interval` seconds records the stacks of the
+    threads currently handling a replayed request.
+    """
+
+    def __init__(self, interval):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.active = set()
+        self.stacks = Counter()
+        self._done = threading.Event()
+
+    @staticmethod
+    def _frame_name(frame):
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            frames = sys._current_frames()
+            for ident in list(self.active):
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None:
+                    stack.append(self._frame_name(frame))
+                    frame = frame.f_back
+                if stack:
+                    self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+    def report(self, output, top):
+        total = sum(self.stacks.values())
+        own, inclusive = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            own[frames[-1]] += count
+            for frame in set(frames):
+                inclusive[frame] += count
+        print(f"\n{total} samples every {self.interval * 1000:g} ms")
+        for title, counter in (("self", own), ("inclusive", inclusive)):
+            print(f"{'%':>6}  top {title}")
+            for frame, count in counter.most_common(top):
+                print(f"{100 * count / total:6.1f}  {frame}")
+        if output:
+            with open(output, "w", encoding="utf-8") as f:
+                f.writelines(f"{stack} {count}\n" for stack, count in self.stacks.items())
+
+
+class Replayer:
+    def __init__(self, profile, sampler=None):
+        self.profile = profile
+        self.sampler = sampler
+        self.tokens = {}
+        self.latencies = {}
+        self.recorded = {}
+        self.errors = Counter()
+        self.profilers = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _client(self):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            import app
+
+            client = self._local.client = app.server.test_client()
+            if self.profile == "cprofile":
+                self._local.profiler = cProfile.Profile()
+                with self._lock:
+                    self.profilers.append(self._local.profiler)
+        return client
+
+    @staticmethod
+    def _fill_password(body):
+        """
+        Puts the roster password back into a login request (it is redacted
+        in the trace).
+        """
+        import studies
+
+        values = {item.get("id"): item.get("value") for item in body.get("state", []) if isinstance(item, dict)}
+        if "login-password" not in values or values["login-password"] is not None:
+            return body
+        session = values.get("session-store") or {}
+        study = studies.registry.get(session.get("study")) or studies.registry.resolve()
+        panelist = studies.registry.roster(study).get(values.get("login-username")) if study else None
+        password = panelist.password if panelist is not None else None
+        body["state"] = [
+            {**item, "value": password} if isinstance(item, dict) and item.get("id") == "login-password" else item
+            for item in body["state"]
+        ]
+        return body
+
+    def send(self, entry):
+        client = self._client()
+        with self._lock:
+            body = swap_tokens(entry["body"], self.tokens)
+        if entry["callback"] == "handle_login":
+            body = self._fill_password(body)
+        profiler = getattr(self._local, "profiler", None)
+        ident = threading.get_ident()
+        if self.sampler is not None:
+            self.sampler.active.add(ident)
+        if profiler is not None:
+            profiler.enable()
+        start = time.perf_counter()
+        response = client.post("/_dash-update-component", json=body)
+        seconds = time.perf_counter() - start
+        if profiler is not None:
+            profiler.disable()
+        if self.sampler is not None:
+            self.sampler.active.discard(ident)
+
+        name = entry["callback"]
+        with self._lock:
+            self.latencies.setdefault(name, []).append(seconds)
+            self.recorded.setdefault(name, []).append(entry["ms"] / 1000)
+            if response.status_code != entry["status"]:
+                self.errors[name] += 1
+            if entry.get("session"):
+                store = ((response.get_json(silent=True) or {}).get("response") or {}).get("session-store") or {}
+                token = (store.get("data") or {}).get("token")
+                if token:
+                    self.tokens[entry["session"]] = token
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded callback traces under a profiler.")
+    parser.add_argument("traces", nargs="+", help="trace files or directories of trace files")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="1 = recorded pace, 10 = ten times faster, 0 = back to back in one thread")
+    parser.add_argument("--threads", type=int, default=8, help="concurrent requests when --speed > 0")
+    parser.add_argument("--profile", choices=["cprofile", "sample", "none"], default="cprofile")
+    parser.add_argument("--interval", type=float, default=5, help="sampling interval in ms (--profile sample)")
+    parser.add_argument("--output", help="write the profile to this file")
+    parser.add_argument("--top", type=int, default=25, help="functions to list")
+    parser.add_argument("--sheets-latency", type=float, default=0.2, help="seconds per stubbed Sheets API call")
+    args = parser.parse_args()
+
+    entries = tracing.read(trace_files(args.traces))
+    if not entries:
+        sys.exit("no trace entries found")
+
+    os.chdir(ROOT)
+    # Configure the in-process app before importing it; never re-record the replay
+    os.environ["TRACE_DIR"] = ""
+    os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="replay-"))
+    os.environ["SHEETS_BACKEND"] = "stub"
+    os.environ["SHEETS_STUB_LATENCY"] = str(args.sheets_latency)
+    import app  # noqa: F401
+
+    sampler = Sampler(args.interval / 1000) if args.profile == "sample" else None
+    replayer = Replayer(args.profile, sampler)
+    if sampler is not None:
+        sampler.start()
+
+    t0 = entries[0]["ts"]
+    start = time.perf_counter()
+    if args.speed <= 0:
+        for entry in entries:
+            replayer.send(entry)
+    else:
+        # Requests of one session wait for the previous one of that session
+        last, futures = {}, []
+
+        def run(entry, previous):
+            if previous is not None:
+                previous.result()
+            replayer.send(entry)
+
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            for entry in entries:
+                delay = (entry["ts"] - t0) / args.speed - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+                key = entry.get("session") or tracing.session_token(entry["body"])
+                future = pool.submit(run, entry, last.get(key))
+                futures.append(future)
+                if key:
+                    last[key] = future
+        for future in futures:
+            future.result()
+    wall = time.perf_counter() - start
+    if sampler is not None:
+        sampler.stop()
+
+    span = entries[-1]["ts"] - t0
+    print(f"{len(entries)} requests recorded over {span:.1f}s, replayed in {wall:.2f}s")
+    print(f"{'callback':<22}{'count':>7}{'err':>5}{'rec p50':>9}{'rec p95':>9}{'p50 ms':>9}{'p95 ms':>9}")
+    for name, latencies in sorted(replayer.latencies.items()):
+        recorded = replayer.recorded[name]
+        print(f"{name:<22}{len(latencies):>7}{replayer.errors[name]:>5}"
+              f"{percentile(recorded, 50) * 1000:>9.1f}{percentile(recorded, 95) * 1000:>9.1f}"
+              f"{percentile(latencies, 50) * 1000:>9.1f}{percentile(latencies, 95) * 1000:>9.1f}")
+
+    if args.profile == "cprofile":
+        stats = pstats.Stats(*replayer.profilers, stream=io.StringIO())
+        if args.output:
+            stats.dump_stats(args.output)
+        stats.stream = sys.stdout
+        print()
+        stats.sort_stats("cumulative").print_stats(args.top)
+    elif sampler is not None:
+        sampler.report(args.output, args.top)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+# Gunicorn settings, picked up automatically by `gunicorn app:server`.
+#
+# With preload (the default) the app is imported once in the master process
+# and warmed up (roster, view templates, Sheets client imports) before the
+# workers are forked, so each worker starts with everything already loaded
+# and shares those pages with the master copy-on-write. GUNICORN_PRELOAD=0
+# loads the app in every worker instead (needed for --reload).
+#
+# Sessions kept in one worker's memory are invisible to the others, so with
+# more than one worker the SQLite session backend is forced (this file is read
+# before the app is imported).
+import gc
+import os
+
+bind = os.environ.get("GUNICORN_BIND", f"0.0.0.0:{os.environ.get('PORT', '8000')}")
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "60"))
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") != "0"
+
+if workers > 1 and os.environ.get("SESSION_BACKEND", "memory") == "memory":
+    os.environ["SESSION_BACKEND"] = "sqlite"
+
+
+def when_ready(server):
+    if not preload_app:
+        return
+    import app
+
+    panelists = app.warm_up()
+    server.log.info("Warmed up: %d panelists, view templates cached", panelists)
+    # Move everything loaded so far out of the collector's reach: garbage
+    # collections in the workers would otherwise touch (and so copy) these
+    # shared pages.
+    gc.freeze()
@@ -0,0 +1,250 @@
+import json
+from functools import lru_cache
+
+from dash import dcc, html
+import dash_bootstrap_components as dbc
+from plotly.io.json import to_json_plotly
+
+import metrics
+
+# --- VIEW TEMPLATES ---
+# The login, info, instructions, evaluation and ranking views are the same
+# for every panelist apart from a header text. Each one is built once, then
+# serialized once into the JSON-ready dict form Dash sends to the browser
+# ({"type", "namespace", "props"}). Per request we only copy the path down to
+# the header and patch its text; the rest of the (shared, read-only) tree is
+# reused as is, so neither building nor re-serializing the components is
+# repeated on every navigation.
+
+ATTRIBUTES = ["Màu sắc", "Hương sản phẩm", "Vị ngọt", "Vị chua", "Vị đắng", "Vị chát", "Hậu vị"]
+RANK_TITLES = ["Ngon nhất", "Thứ hai", "Thứ ba", "Thứ 4", "Thứ 5"]
+PREFERENCE_OPTIONS = [
+    "1 - Cực kỳ không thích", "2 - Rất không thích", "3 - Không thích",
+    "4 - Tương đối không thích", "5 - Không thích cũng không ghét", "6 - Tương đối thích",
+    "7 - Thích", "8 - Rất thích", "9 - Cực kỳ thích"
+]
+
+
+def serialize(component):
+    """
+    Converts a component tree into the plain dict form Dash sends to the browser.
+    """
+    return json.loads(to_json_plotly(component))
+
+
+def _with_text(node, path, text):
+    """
+    Returns a copy of serialized `node` where the children of the component
+    reached through `path` (a list of child indices) are replaced by `text`.
+    Only the nodes along the path are copied.
+    """
+    node = dict(node)
+    props = node["props"] = dict(node["props"])
+    if not path:
+        props["children"] = text
+        return node
+    children = props["children"]
+    if isinstance(children, dict):
+        props["children"] = _with_text(children, path[1:], text)
+    else:
+        children = props["children"] = list(children)
+        children[path[0]] = _with_text(children[path[0]], path[1:], text)
+    return node
+
+
+# --- COMPONENT BUILDERS (uncached) ---
+def build_login():
+    return dbc.Row(dbc.Col(dbc.Card([
+        dbc.CardHeader("Đăng nhập"),
+        dbc.CardBody([
+            dbc.Input(id='login-username', placeholder='Tên đăng nhập', type='text', className="mb-3"),
+            dbc.Input(id='login-password', placeholder='Mật khẩu', type='password', className="mb-3"),
+            dbc.Button("Đăng nhập", id='login-button', color='primary', n_clicks=0, className="w-100"),
+            html.Div(id='login-error', className="mt-3")
+        ])
+    ]), width=12, md=6, lg=4), justify="center")
+
+
+def build_study_picker(studies):
+    """
+    List of the hosted studies, shown when the URL does not select one.
+    """
+    return dbc.Row(dbc.Col(dbc.Card([
+        dbc.CardHeader("Chọn nghiên cứu"),
+        dbc.ListGroup([
+            dbc.ListGroupItem(study.title, href=f"/{study.code}", external_link=True) for study in studies
+        ], flush=True),
+    ]), width=12, md=6, lg=4), justify="center")
+
+
+def build_user_info(user):
+    return dbc.Card([
+        dbc.CardHeader(f"Thông tin người tham gia (Chào {user})"),
+        dbc.CardBody([
+            dbc.Row([
+                dbc.Col(dbc.Input(id='info-name', placeholder='Họ và tên', className="mb-3"), width=12),
+                dbc.Col(dbc.Select(id='info-gender', options=["Nam", "Nữ", "Khác"], placeholder="Giới tính", className="mb-3"), width=6),
+                dbc.Col(dbc.Input(id='info-age', placeholder='Tuổi', type='number', min=1, step=1, className="mb-3"), width=6),
+            ]),
+            html.P("Nghề nghiệp của bạn là gì?"),
+            dbc.RadioItems(id='info-occupation', options=["Sinh viên", "Nhân viên văn phòng", "Doanh nhân", "Lao động tự do", "Nghề nghiệp khác"], inline=True, className="mb-3"),
+            html.P("Tần suất sử dụng nước tăng lực đóng lon của bạn?"),
+            dbc.RadioItems(id='info-frequency', options=["6 lần/ tuần", "5 lần/ tuần", "4 lần/ tuần", "3 lần/ tuần", "2 lần/tuần", "1 lần/ tuần", "ít hơn 1 lần/ tuần"], inline=True, className="mb-3"),
+            dbc.Button("Tiếp tục", id='info-button', color='primary', n_clicks=0, className="w-100"),
+            html.Div(id='info-error', className="mt-3")
+        ])
+    ])
+
+
+def build_instructions():
+    return dbc.Card([
+        dbc.CardHeader("Hướng dẫn cảm quan"),
+        dbc.CardBody([
+            html.P("Anh/Chị sẽ được nhận các mẫu nước tăng lực được gán mã số, vui lòng đánh giá lần lượt các mẫu từ trái sang phải theo thứ tự đã cung cấp. Anh/Chị vui lòng đánh giá mỗi mẫu theo trình tự sau:"),
+            html.Ol([
+                html.Li("Dùng thử sản phẩm và đánh giá cường độ các tính chất MÀU SẮC, MÙI và HƯƠNG VỊ."),
+                html.Li("Cho biết cường độ của mỗi tính chất mà anh/chị cho là lý tưởng (cường độ mà anh/chị mong muốn cho sản phẩm nước tăng lực này)."),
+                html.Li("Nếu cường độ tính chất của mẫu phù hợp với mong muốn của anh/chị, vui lòng chọn cường độ lý tưởng bằng với cường độ tính chất của mẫu."),
+                html.Li("Cho biết độ ưa thích chung đối với mẫu sản phẩm này."),
+            ]),
+            html.P(html.B("LƯU Ý:", style={'color': 'red'})),
+            html.Ul([
+                html.Li("Anh/chị lưu ý sử dụng nước và bánh để thanh vị trước và sau mỗi mẫu thử."),
+                html.Li("Anh/chị vui lòng không trao đổi trong quá trình đánh giá mẫu."),
+                html.Li("Anh/chị vui lòng liên hệ với thực nghiệm viên nếu có bất kì thắc mắc nào trong quá trình đánh giá."),
+            ]),
+            dbc.Button("Bắt đầu đánh giá", id='start-eval-button', color='primary', n_clicks=0, className="mt-3 w-100"),
+        ])
+    ])
+
+
+def evaluation_title(sample, idx, total):
+    return f"Đánh giá mẫu: {sample} ({idx + 1}/{total})"
+
+
+def build_evaluation(sample, idx, total, attributes=ATTRIBUTES, client=False):
+    # In client-side paging mode the form is driven by a clientside callback,
+    # so its title gets an id and the button/error ids differ from the ones
+    # bound to the server-side handle_evaluation callback.
+    title_props = {'id': 'eval-title'} if client else {}
+    eval_form = [html.H4(evaluation_title(sample, idx, total), **title_props)]
+    for attr in attributes:
+        eval_form.extend([
+            html.H5(f"🔸 {attr}", className="mt-4"),
+            dbc.Row([
+                dbc.Col([html.Label("Cường độ trong mẫu"), dcc.Slider(1, 100, 1, value=50, id={'type': 'slider-sample', 'index': attr}, marks=None, tooltip={"placement": "bottom", "always_visible": True})]),
+                dbc.Col([html.Label("Cường độ lý tưởng"), dcc.Slider(1, 100, 1, value=50, id={'type': 'slider-ideal', 'index': attr}, marks=None, tooltip={"placement": "bottom", "always_visible": True})]),
+            ]),
+            html.Hr()
+        ])
+
+    eval_form.append(html.Div([
+        html.P("Điểm ưa thích chung"),
+        dbc.RadioItems(id='eval-preference', options=PREFERENCE_OPTIONS, className="mb-3")
+    ]))
+    eval_form.append(dbc.Button("Tiếp tục", id='eval-next-button' if client else 'eval-button', color='primary', n_clicks=0, className="w-100"))
+    eval_form.append(html.Div(id='client-eval-error' if client else 'eval-error', className="mt-3"))
+    return html.Div(eval_form)
+
+
+def build_ranking(sample_codes, rank_titles=RANK_TITLES, client=False):
+    cols = []
+    for i, title in enumerate(rank_titles[:len(sample_codes)]):
+        cols.append(dbc.Col(
+            dbc.Card([
+                dbc.CardHeader(title),
+                dbc.CardBody(dcc.Dropdown(list(sample_codes), id={'type': 'rank-dropdown', 'index': i}))
+            ]),
+            width=12, md=6, lg=2
+        ))
+
+    return html.Div([
+        html.H4("Thứ hạng các sản phẩm"),
+        html.P("Hãy sắp xếp các sản phẩm theo thứ tự ngon nhất đến kém ngon nhất", className="text-muted"),
+        dbc.Row(cols, className="g-3"),
+        dbc.Button("Xác nhận và Hoàn thành", id='client-rank-button' if client else 'rank-button', color='success', n_clicks=0, className="mt-4 w-100"),
+        html.Div(id='client-rank-error' if client else 'rank-error', className="mt-3")
+    ])
+
+
+def build_client_evaluation(sample_codes, start=0, attributes=ATTRIBUTES, rank_titles=RANK_TITLES):
+    """
+    The whole evaluation sequence in one page for client-side paging: the
+    plan (sample order, attributes) is sent once, the browser pages through
+    the samples and collects ratings in 'eval-ratings', then shows the
+    ranking section. Nothing is sent to the server until the final submit.
+    """
+    total = len(sample_codes)
+    return html.Div([
+        dcc.Store(id='eval-plan', data={'samples': list(sample_codes), 'start': start, 'attributes': list(attributes)}),
+        dcc.Store(id='eval-ratings', data=[]),
+        html.Div(build_evaluation(sample_codes[start], start, total, attributes, client=True), id='eval-section'),
+        html.Div(build_ranking(sorted(sample_codes), rank_titles, client=True), id='ranking-section', style={'display': 'none'}),
+    ])
+
+
+# --- CACHED TEMPLATES ---
+@lru_cache(maxsize=None)
+def _login_template():
+    return serialize(build_login())
+
+
+@lru_cache(maxsize=None)
+def _user_info_template():
+    return serialize(build_user_info(""))
+
+
+@lru_cache(maxsize=None)
+def _instructions_template():
+    return serialize(build_instructions())
+
+
+@lru_cache(maxsize=64)
+def _evaluation_template(attributes):
+    return serialize(build_evaluation("", 0, 0, attributes))
+
+
+@lru_cache(maxsize=1024)
+def _ranking_template(sample_codes, rank_titles):
+    return serialize(build_ranking(sample_codes, rank_titles))
+
+
+@lru_cache(maxsize=1024)
+def _client_evaluation_template(sample_codes, start, attributes, rank_titles):
+    return serialize(build_client_evaluation(sample_codes, start, attributes, rank_titles))
+
+
+def login_layout():
+    return _login_template()
+
+
+def user_info_layout(user):
+    # Card > CardHeader
+    return _with_text(_user_info_template(), [0], f"Thông tin người tham gia (Chào {user})")
+
+
+def instructions_layout():
+    return _instructions_template()
+
+
+def evaluation_layout(sample, idx, total, attributes=ATTRIBUTES):
+    # Div > H4
+    return _with_text(_evaluation_template(tuple(attributes)), [0], evaluation_title(sample, idx, total))
+
+
+def ranking_layout(sample_codes, rank_titles=RANK_TITLES):
+    return _ranking_template(tuple(sample_codes), tuple(rank_titles))
+
+
+def client_evaluation_layout(sample_codes, start=0, attributes=ATTRIBUTES, rank_titles=RANK_TITLES):
+    return _client_evaluation_template(tuple(sample_codes), start, tuple(attributes), tuple(rank_titles))
+
+
+metrics.register_collector(metrics.cache_collector("layout_template_cache", {
+    "login": _login_template,
+    "user_info": _user_info_template,
+    "instructions": _instructions_template,
+    "evaluation": _evaluation_template,
+    "ranking": _ranking_template,
+    "client_evaluation": _client_evaluation_template,
+}))
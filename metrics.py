@@ -0,0 +1,229 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# --- METRICS ---
+# A small in-process registry of counters and latency histograms, exposed in
+# the Prometheus text format on /metrics, plus one structured JSON log line
+# per Dash callback. Each gunicorn worker keeps its own registry (scrape every
+# worker, or run a single worker, to see the whole picture).
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# METRICS_LOG=0 turns the per-callback JSON log lines off
+METRICS_LOG = os.environ.get("METRICS_LOG", "1") != "0"
+
+log = logging.getLogger("panel.metrics")
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {"ts": round(record.created, 3), "level": record.levelname.lower(), "logger": record.name}
+        if isinstance(record.msg, dict):
+            entry.update(record.msg)
+        else:
+            entry["message"] = record.getMessage()
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+if not log.handlers:
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(_JsonFormatter())
+    log.addHandler(_handler)
+    log.setLevel(logging.INFO)
+    log.propagate = False
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_str(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+        self._collectors = []
+
+    def inc(self, name, amount=1, help=None, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+            if help:
+                self._help.setdefault(name, help)
+
+    def observe(self, name, value, help=None, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(BUCKETS), 0.0, 0]
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += value
+            histogram[2] += 1
+            if help:
+                self._help.setdefault(name, help)
+
+    def register_collector(self, collector):
+        """
+        `collector()` is called on every scrape and returns an iterable of
+        (name, type, help, labels dict, value) for gauges/counters computed
+        from other state (cache statistics, queue depths...).
+        """
+        self._collectors.append(collector)
+
+    def render(self):
+        """
+        Prometheus text exposition format (version 0.0.4).
+        """
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (list(h[0]), h[1], h[2])) for key, h in self._histograms.items())
+            help_texts = dict(self._help)
+
+        last = None
+        for (name, labels), value in counters:
+            if name != last:
+                lines.append(f"# HELP {name} {help_texts.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+                last = name
+            lines.append(f"{name}{_label_str(labels)} {value}")
+
+        last = None
+        for (name, labels), (buckets, total, count) in histograms:
+            if name != last:
+                lines.append(f"# HELP {name} {help_texts.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                last = name
+            for bound, bucket_count in zip(BUCKETS, buckets):
+                lines.append(f"{name}_bucket{_label_str(labels + (('le', repr(bound)),))} {bucket_count}")
+            lines.append(f"{name}_bucket{_label_str(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_label_str(labels)} {total}")
+            lines.append(f"{name}_count{_label_str(labels)} {count}")
+
+        # Samples of one metric must be contiguous in the exposition format
+        collected = {}
+        for collector in self._collectors:
+            try:
+                samples = list(collector())
+            except Exception as e:
+                log.warning({"event": "collector_failed", "error": repr(e)})
+                continue
+            for name, metric_type, help_text, labels, value in samples:
+                entry = collected.setdefault(name, (metric_type, help_text, []))
+                entry[2].append(f"{name}{_label_str(tuple(sorted(labels.items())))} {value}")
+        for name, (metric_type, help_text, sample_lines) in collected.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            lines.extend(sample_lines)
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+inc = registry.inc
+observe = registry.observe
+register_collector = registry.register_collector
+
+
+@contextmanager
+def timed(name, help=None, **labels):
+    """
+    Records the duration of the block in histogram `name` (seconds),
+    counting failures in `<name>_errors_total`.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        inc(f"{name}_errors_total", help=f"Failures of {name}", error=type(e).__name__, **labels)
+        raise
+    finally:
+        observe(name, time.perf_counter() - start, help=help, **labels)
+
+
+def cache_collector(name, caches):
+    """
+    Collector exposing hits/misses of functools.lru_cache functions, as
+    `<name>_hits_total` / `<name>_misses_total` labelled by cache.
+    """
+    def collect():
+        for cache_name, function in caches.items():
+            info = function.cache_info()
+            yield f"{name}_hits_total", "counter", f"{name} cache hits", {"cache": cache_name}, info.hits
+            yield f"{name}_misses_total", "counter", f"{name} cache misses", {"cache": cache_name}, info.misses
+    return collect
+
+
+# --- DASH / FLASK INSTRUMENTATION ---
+def instrument(dash_app):
+    """
+    Times every Dash callback request on the app's Flask server (wall time,
+    request/response bytes, exceptions) and serves /metrics.
+    """
+    from flask import Response, g, got_request_exception, request
+
+    server = dash_app.server
+    names = {}
+
+    def callback_name():
+        if not request.path.endswith("_dash-update-component"):
+            return None
+        body = request.get_json(silent=True) or {}
+        output = body.get("output", "")
+        name = names.get(output)
+        if name is None:
+            entry = dash_app.callback_map.get(output, {})
+            function = entry.get("callback")
+            name = getattr(function, "__name__", None) or output
+            names[output] = name
+        return name
+
+    @server.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @server.after_request
+    def _record_request(response):
+        start = g.pop("metrics_start", None)
+        name = callback_name()
+        if start is None or name is None:
+            return response
+        seconds = time.perf_counter() - start
+        bytes_in = request.content_length or 0
+        bytes_out = 0 if response.direct_passthrough else (response.calculate_content_length() or 0)
+        observe("dash_callback_seconds", seconds, help="Wall time of Dash callback requests", callback=name)
+        inc("dash_callback_requests_total", help="Dash callback requests", callback=name, status=response.status_code)
+        inc("dash_callback_request_bytes_total", bytes_in, help="Bytes received by Dash callbacks", callback=name)
+        inc("dash_callback_response_bytes_total", bytes_out, help="Bytes sent by Dash callbacks", callback=name)
+        if METRICS_LOG:
+            log.info({
+                "event": "callback", "callback": name, "status": response.status_code,
+                "ms": round(seconds * 1000, 3), "bytes_in": bytes_in, "bytes_out": bytes_out,
+            })
+        return response
+
+    def _record_exception(sender, exception, **extra):
+        name = callback_name() or request.path
+        inc("dash_callback_exceptions_total", help="Exceptions raised by Dash callbacks",
+            callback=name, exception=type(exception).__name__)
+        log.error({"event": "callback_exception", "callback": name, "exception": repr(exception)})
+
+    got_request_exception.connect(_record_exception, server, weak=False)
+
+    @server.route("/metrics")
+    def _metrics():
+        return Response(registry.render(), mimetype="text/plain; version=0.0.4")
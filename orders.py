@@ -0,0 +1,110 @@
+import itertools
+import math
+
+import numpy as np
+
+# --- PRESENTATION ORDERS ---
+# Balanced serving orders generated as integer arrays (sample indices), so a
+# study can list its sample codes once instead of typing an order string for
+# every panelist in the roster workbook.
+#
+# A Williams design over n samples is a Latin square (every sample once in
+# every position) in which every sample is also immediately preceded by every
+# other sample exactly once, balancing first-order carry-over effects. For an
+# odd n this needs two squares (2n sequences).
+#
+# When each panelist only tastes k < n samples, the design is a balanced
+# incomplete block design: every k-subset of the samples is a block, served in
+# the orders of a Williams design over its k samples. Over a full repetition
+# every sample appears equally often in each position, every pair of samples
+# is tasted by the same number of panelists, and carry-over stays balanced.
+# That takes C(n, k) blocks, so the design is limited to MAX_DESIGN_ROWS
+# sequences; a panel smaller than one repetition should set a seed, which
+# draws its sequences at random instead of block after block.
+
+MAX_DESIGN_ROWS = 100_000
+
+
+def williams_design(n_samples):
+    """
+    Williams design for `n_samples` samples: an int array of shape
+    (n, n) for even n, (2n, n) for odd n; each row is one serving order.
+    """
+    n = n_samples
+    # First row 0, 1, n-1, 2, n-2, ...; the other rows add r modulo n
+    j = np.arange(n)
+    first = np.where(j % 2 == 1, (j + 1) // 2, (n - j // 2) % n)
+    square = (first[None, :] + np.arange(n)[:, None]) % n
+    if n % 2:
+        square = np.concatenate([square, square[:, ::-1]])
+    return square
+
+
+def _williams_rows(k):
+    return k if k % 2 == 0 else 2 * k
+
+
+def design_size(n_samples, per_panelist=None):
+    """
+    Number of sequences in the design of `n_samples` samples, `per_panelist`
+    (default all) served to each panelist.
+    """
+    k = n_samples if per_panelist is None else per_panelist
+    return math.comb(n_samples, k) * _williams_rows(k)
+
+
+def check_design(n_samples, per_panelist=None):
+    """
+    Raises ValueError unless `per_panelist` of `n_samples` samples can be
+    served in a design of at most MAX_DESIGN_ROWS sequences.
+    """
+    if per_panelist is None:
+        return
+    if isinstance(per_panelist, bool) or not isinstance(per_panelist, int) or not 1 <= per_panelist <= n_samples:
+        raise ValueError(f"cannot serve {per_panelist!r} of {n_samples} samples to each panelist")
+    if design_size(n_samples, per_panelist) > MAX_DESIGN_ROWS:
+        raise ValueError(f"the design for {per_panelist} of {n_samples} samples has more than "
+                         f"{MAX_DESIGN_ROWS} sequences")
+
+
+def incomplete_block_design(n_samples, per_panelist):
+    """
+    Balanced incomplete block design: every `per_panelist`-subset of the
+    samples, each in the orders of a Williams design over its samples. An int
+    array of shape (design_size(n, k), k).
+    """
+    k = per_panelist
+    blocks = np.array(list(itertools.combinations(range(n_samples), k)), dtype=int)
+    return blocks[:, williams_design(k)].reshape(-1, k)
+
+
+def presentation_orders(panelists, n_samples, per_panelist=None, seed=None):
+    """
+    Serving orders: an int array of shape (len(panelists), per_panelist) of
+    sample indices. `panelists` holds each panelist's seat, i.e. their
+    position in the order panelists joined the study (or is a count n for
+    seats 0..n-1); seat s gets sequence s of the design, repeated as needed,
+    so an order does not depend on who else is on the roster. With a `seed`
+    the sequences are shuffled within each full repetition of the design,
+    which keeps the balance.
+    """
+    check_design(n_samples, per_panelist)
+    if per_panelist is None or per_panelist == n_samples:
+        design = williams_design(n_samples)
+    else:
+        design = incomplete_block_design(n_samples, per_panelist)
+    seats = np.arange(panelists) if np.ndim(panelists) == 0 else np.asarray(panelists, dtype=int)
+    m = len(design)
+    rows = seats % m
+    if seed is not None and len(seats):
+        repetitions = seats.max() // m + 1
+        shuffled = np.random.default_rng(seed).random((repetitions, m)).argsort(axis=1)
+        rows = shuffled[seats // m, seats % m]
+    return design[rows]
+
+
+def sample_codes(orders, samples):
+    """
+    Maps an order array to lists of sample codes.
+    """
+    return np.asarray(samples, dtype=object)[orders].tolist()
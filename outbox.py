@@ -0,0 +1,254 @@
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import batching
+import metrics
+import results_store
+import sheets
+import storage
+
+# --- WRITE-BEHIND OUTBOX ---
+# Finished sessions are marked for upload in a local SQLite table and the
+# request returns immediately. The records themselves are read from the local
+# results store (results_store.py), of which the sheet is only a mirror. A
+# background thread drains the table into Google Sheets with retries, so a
+# slow or failing Sheets API never blocks a panelist, and rows queued before
+# a crash/redeploy are sent on restart.
+# Sessions that finish close together are written as one batch (batching.py).
+# A session is queued in the same transaction that stores its ranking
+# (submit), so a finished session cannot be left out if the browser never
+# shows the thank-you view. Each session carries a submission ID; enqueueing
+# the same ID again (a double submit, a retry) is a no-op, so a session's rows
+# are appended to the sheet exactly once.
+
+PENDING = "pending"
+SENDING = "sending"
+SYNCED = "synced"
+
+MAX_BACKOFF = 300
+# A row claimed by a worker that died mid-send is retried after this delay.
+# A live sender refreshes its claim every CLAIM_TIMEOUT / 4 seconds, since a
+# send may wait on the rate limiter far longer than this (ratelimit.py)
+CLAIM_TIMEOUT = 120
+
+_schema_ready = set()
+
+
+def _db():
+    conn = storage.connect()
+    if storage.DB_PATH not in _schema_ready:
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                submission_id TEXT UNIQUE,
+                sheet_id TEXT NOT NULL,
+                row_count INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL DEFAULT 0,
+                claimed_at REAL,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                synced_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS outbox_status ON outbox (status, next_attempt_at);
+        """)
+        _schema_ready.add(storage.DB_PATH)
+    return conn
+
+
+def enqueue(submission_id, sheet_id=sheets.SHEET_ID):
+    """
+    Durably marks a finished submission (whose records are in the results
+    store) for upload. Returns the outbox id. If `submission_id` was already
+    enqueued, nothing changes and the id of the existing entry is returned.
+    """
+    global _queued_rows
+    conn = _db()
+    row = conn.execute("SELECT id FROM outbox WHERE submission_id = ?", (submission_id,)).fetchone()
+    if row:
+        return row[0]
+    row_count = len(results_store.submission_records(submission_id))
+    cur = conn.execute(
+        "INSERT OR IGNORE INTO outbox (submission_id, sheet_id, row_count, created_at) VALUES (?, ?, ?, ?)",
+        (submission_id, sheet_id, row_count, time.time()),
+    )
+    if not cur.rowcount:
+        # Another worker enqueued the same submission in the meantime
+        return conn.execute("SELECT id FROM outbox WHERE submission_id = ?", (submission_id,)).fetchone()[0]
+    ensure_flusher()
+    # Flush early instead of waiting for the batch window once enough rows wait
+    _queued_rows += row_count
+    if _queued_rows >= batching.BATCH_MAX_ROWS:
+        _wakeup.set()
+    return cur.lastrowid
+
+
+def submit(submission_id, *new_records, study=None, sheet_id=sheets.SHEET_ID):
+    """
+    Appends the last records of a submission (its ranking) to the results
+    store and marks the submission for upload in the same transaction.
+    Returns the outbox id.
+    """
+    _db()  # create the table first: executescript would commit the transaction
+    with results_store.transaction():
+        results_store.append(submission_id, *new_records, study=study)
+        return enqueue(submission_id, sheet_id)
+
+
+def status(outbox_id):
+    """
+    Returns (status, last_error) for an outbox entry, or (None, None) if unknown.
+    """
+    row = _db().execute("SELECT status, last_error FROM outbox WHERE id = ?", (outbox_id,)).fetchone()
+    return row if row else (None, None)
+
+
+def pending_count():
+    return _db().execute("SELECT COUNT(*) FROM outbox WHERE status != ?", (SYNCED,)).fetchone()[0]
+
+
+def _claim(max_rows=None):
+    """
+    Atomically marks due entries of one sheet as being sent by this process,
+    up to `max_rows` rows (at least one entry).
+    """
+    max_rows = max_rows or batching.BATCH_MAX_ROWS
+    conn = _db()
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Release entries whose sender disappeared
+        conn.execute(
+            "UPDATE outbox SET status = ? WHERE status = ? AND claimed_at < ?",
+            (PENDING, SENDING, now - CLAIM_TIMEOUT),
+        )
+        cursor = conn.execute(
+            "SELECT id, sheet_id, submission_id, attempts, row_count FROM outbox "
+            "WHERE status = ? AND next_attempt_at <= ? ORDER BY id",
+            (PENDING, now),
+        )
+        rows, total = [], 0
+        for row in cursor:
+            if rows and (row[1] != rows[0][1] or total + row[4] > max_rows):
+                continue
+            rows.append(row)
+            total += row[4]
+            if total >= max_rows:
+                break
+        cursor.close()
+        conn.executemany(
+            "UPDATE outbox SET status = ?, claimed_at = ? WHERE id = ?",
+            [(SENDING, now, row[0]) for row in rows],
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return rows
+
+
+@contextmanager
+def _holding(ids):
+    """
+    Keeps the claim on outbox entries `ids` fresh while the block runs, so
+    other workers do not take them back as abandoned.
+    """
+    done = threading.Event()
+
+    def heartbeat():
+        while not done.wait(CLAIM_TIMEOUT / 4):
+            _db().executemany(
+                "UPDATE outbox SET claimed_at = ? WHERE id = ? AND status = ?",
+                [(time.time(), i, SENDING) for i in ids],
+            )
+
+    thread = threading.Thread(target=heartbeat, name="outbox-claim", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        done.set()
+        thread.join()
+
+
+def _mark_synced(ids):
+    _db().executemany(
+        "UPDATE outbox SET status = ?, synced_at = ?, last_error = NULL WHERE id = ?",
+        [(SYNCED, time.time(), i) for i in ids],
+    )
+
+
+def _mark_failed(ids, attempts, error):
+    # Exponential backoff with jitter, capped at MAX_BACKOFF seconds
+    delay = min(MAX_BACKOFF, 2 ** attempts) * (0.5 + random.random() / 2)
+    _db().executemany(
+        "UPDATE outbox SET status = ?, attempts = attempts + 1, next_attempt_at = ?, last_error = ? WHERE id = ?",
+        [(PENDING, time.time() + delay, error, i) for i in ids],
+    )
+
+
+def flush_once(client=None):
+    """
+    Sends every due outbox entry to Google Sheets, one batch per append.
+    Returns the number of entries sent.
+    """
+    global _queued_rows
+    _queued_rows = 0
+    sent = 0
+    while True:
+        rows = _claim()
+        if not rows:
+            return sent
+        ids = [row[0] for row in rows]
+        sheet_id = rows[0][1]
+        attempts = max(row[3] for row in rows)
+        client = client or sheets.connect_to_google_sheets()
+        if client is None:
+            _mark_failed(ids, attempts, "Lỗi kết nối Google Sheets")
+            return sent
+        with _holding(ids):
+            written = batching.write_batch([results_store.submission_records(row[2]) for row in rows], sheet_id, client)
+        if written:
+            _mark_synced(ids)
+            sent += len(ids)
+        else:
+            _mark_failed(ids, attempts, "Lỗi khi ghi vào Google Sheet")
+            return sent
+
+
+_flusher_lock = threading.Lock()
+_flusher_pid = None
+_wakeup = threading.Event()
+_queued_rows = 0
+
+
+def _run_flusher():
+    while True:
+        _wakeup.wait(batching.BATCH_WINDOW)
+        _wakeup.clear()
+        try:
+            flush_once()
+        except Exception as e:
+            print(f"Lỗi khi đồng bộ outbox: {e}")
+
+
+def ensure_flusher():
+    """
+    Starts the background flusher in this process (once per forked worker).
+    """
+    global _flusher_pid
+    if _flusher_pid == os.getpid():
+        return
+    with _flusher_lock:
+        if _flusher_pid != os.getpid():
+            threading.Thread(target=_run_flusher, name="outbox-flusher", daemon=True).start()
+            _flusher_pid = os.getpid()
+
+
+metrics.register_collector(lambda: [
+    ("outbox_pending_entries", "gauge", "Sessions waiting to be synced to Google Sheets", {}, pending_count()),
+])
@@ -0,0 +1,206 @@
+import os
+import random
+import threading
+import time
+
+import metrics
+import storage
+
+# --- SHEETS API RATE LIMITER ---
+# A token bucket shared by every gunicorn worker through the SQLite database:
+# each Google Sheets API call takes a token, tokens refill at
+# SHEETS_RATE_PER_MINUTE up to SHEETS_RATE_BURST, so the workers together stay
+# under the project quota instead of each discovering it through 429s.
+# When a call still fails with 429 or a 5xx, the whole bucket is paused for an
+# exponentially growing, jittered delay (shared too, since the quota is) and
+# the call is retried, up to SHEETS_MAX_RETRIES times.
+#
+# Writes (appends, header updates) take priority over reads (opening the
+# sheet, reading the header row): a read leaves at least READ_RESERVE tokens
+# in the bucket for writes, and waits while a write in the same process is
+# waiting.
+
+RATE_PER_MINUTE = float(os.environ.get("SHEETS_RATE_PER_MINUTE", "60"))
+BURST = float(os.environ.get("SHEETS_RATE_BURST", "10"))
+READ_RESERVE = float(os.environ.get("SHEETS_READ_RESERVE", "2"))
+MAX_RETRIES = int(os.environ.get("SHEETS_MAX_RETRIES", "5"))
+ACQUIRE_TIMEOUT = float(os.environ.get("SHEETS_ACQUIRE_TIMEOUT", "60"))
+BASE_BACKOFF = 1.0
+MAX_BACKOFF = 64.0
+
+WRITE = "write"
+READ = "read"
+
+BUCKET = "sheets"
+
+_schema_ready = set()
+_lock = threading.Lock()
+_waiting = {WRITE: 0, READ: 0}
+_write_waiting = threading.Condition(_lock)
+
+
+class RateLimitTimeout(Exception):
+    pass
+
+
+def _db():
+    conn = storage.connect()
+    if storage.DB_PATH not in _schema_ready:
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS rate_limit (
+                name TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                paused_until REAL NOT NULL DEFAULT 0,
+                failures INTEGER NOT NULL DEFAULT 0
+            );
+        """)
+        _schema_ready.add(storage.DB_PATH)
+    return conn
+
+
+def _try_take(cost, priority):
+    """
+    Takes `cost` tokens if available. Returns 0 on success, otherwise the
+    number of seconds to wait before trying again.
+    """
+    conn = _db()
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            "SELECT tokens, updated_at, paused_until FROM rate_limit WHERE name = ?", (BUCKET,)
+        ).fetchone()
+        if row is None:
+            tokens, paused_until = BURST, 0.0
+            conn.execute("INSERT INTO rate_limit (name, tokens, updated_at) VALUES (?, ?, ?)", (BUCKET, BURST, now))
+        else:
+            tokens = min(BURST, row[0] + max(0.0, now - row[1]) * RATE_PER_MINUTE / 60)
+            paused_until = row[2]
+        if paused_until > now:
+            wait = paused_until - now
+        else:
+            needed = cost + (READ_RESERVE if priority == READ else 0)
+            needed = min(needed, BURST)
+            wait = 0.0 if tokens >= needed else (needed - tokens) * 60 / RATE_PER_MINUTE
+            if not wait:
+                tokens -= cost
+        conn.execute("UPDATE rate_limit SET tokens = ?, updated_at = ? WHERE name = ?", (tokens, now, BUCKET))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return wait
+
+
+def acquire(cost=1, priority=WRITE, timeout=None):
+    """
+    Blocks until `cost` tokens were taken from the shared bucket. Raises
+    RateLimitTimeout after `timeout` seconds (ACQUIRE_TIMEOUT by default).
+    """
+    deadline = time.monotonic() + (ACQUIRE_TIMEOUT if timeout is None else timeout)
+    start = time.perf_counter()
+    with _lock:
+        _waiting[priority] += 1
+    try:
+        while True:
+            with _lock:
+                while priority == READ and _waiting[WRITE]:
+                    if not _write_waiting.wait(max(0.0, deadline - time.monotonic())):
+                        raise RateLimitTimeout("Hết thời gian chờ hạn mức Google Sheets")
+            wait = _try_take(cost, priority)
+            if not wait:
+                return
+            if time.monotonic() + min(wait, 1.0) > deadline:
+                raise RateLimitTimeout("Hết thời gian chờ hạn mức Google Sheets")
+            # Other workers may free the bucket earlier (or pause it); re-check at least every second
+            time.sleep(min(wait, 1.0) * (0.9 + random.random() / 5))
+    finally:
+        with _lock:
+            _waiting[priority] -= 1
+            if priority == WRITE and not _waiting[WRITE]:
+                _write_waiting.notify_all()
+        metrics.observe("sheets_rate_limit_wait_seconds", time.perf_counter() - start,
+                        help="Time spent waiting for a Sheets API token", priority=priority)
+
+
+def retryable_status(error):
+    """
+    HTTP status of an API error worth retrying (429 or 5xx), else None.
+    """
+    response = getattr(error, "response", None)
+    code = getattr(response, "status_code", None)
+    if code == 429 or (code is not None and 500 <= code < 600):
+        return code
+    return None
+
+
+def _pause(failures):
+    """
+    Pauses the shared bucket after a quota/server error: exponential backoff
+    with jitter, capped at MAX_BACKOFF seconds. Returns the delay.
+    """
+    conn = _db()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("SELECT failures, paused_until FROM rate_limit WHERE name = ?", (BUCKET,)).fetchone()
+        shared_failures = max(failures, row[0] + 1 if row else 1)
+        delay = random.uniform(0.5, 1.0) * min(MAX_BACKOFF, BASE_BACKOFF * 2 ** (shared_failures - 1))
+        paused_until = max(time.time() + delay, row[1] if row else 0)
+        conn.execute(
+            "UPDATE rate_limit SET failures = ?, paused_until = ? WHERE name = ?",
+            (shared_failures, paused_until, BUCKET),
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return delay
+
+
+def _reset():
+    _db().execute("UPDATE rate_limit SET failures = 0 WHERE name = ? AND failures != 0", (BUCKET,))
+
+
+def call(function, *args, cost=1, priority=WRITE, **kwargs):
+    """
+    Calls a Sheets API function under the rate limiter, retrying 429/5xx
+    responses with backoff. Other exceptions propagate immediately.
+    """
+    failures = 0
+    while True:
+        acquire(cost, priority)
+        try:
+            result = function(*args, **kwargs)
+        except Exception as e:
+            status = retryable_status(e)
+            if status is None or failures >= MAX_RETRIES:
+                raise
+            failures += 1
+            delay = _pause(failures)
+            metrics.inc("sheets_rate_limit_retries_total", help="Sheets API calls retried after 429/5xx",
+                        status=status, priority=priority)
+            print(f"Google Sheets trả về {status}, thử lại sau {delay:.1f}s (lần {failures})")
+            continue
+        if failures:
+            _reset()
+        return result
+
+
+def queue_depth():
+    with _lock:
+        return dict(_waiting)
+
+
+def _collect():
+    for priority, count in queue_depth().items():
+        yield "sheets_rate_limit_waiting", "gauge", "Sheets API calls waiting for a token", {"priority": priority}, count
+    row = _db().execute("SELECT tokens, updated_at, paused_until FROM rate_limit WHERE name = ?", (BUCKET,)).fetchone()
+    if row is not None:
+        now = time.time()
+        tokens = min(BURST, row[0] + max(0.0, now - row[1]) * RATE_PER_MINUTE / 60)
+        yield "sheets_rate_limit_tokens", "gauge", "Tokens left in the shared Sheets bucket", {}, round(tokens, 3)
+        yield "sheets_rate_limit_paused_seconds", "gauge", "Remaining backoff pause of the Sheets bucket", {}, round(max(0.0, row[2] - now), 3)
+
+
+metrics.register_collector(_collect)
@@ -0,0 +1,147 @@
+from datetime import datetime
+
+from pytz import timezone
+
+import layouts
+
+# --- RESULT RECORDS ---
+# The flat record schema written to Google Sheets and the Excel download.
+# Per-sample ratings and the final ranking are separate records; the ranking
+# uses a special value in the "sample" column.
+
+TIMEZONE = timezone("Asia/Ho_Chi_Minh")
+RANKING_SAMPLE = "Xếp hạng tổng thể"
+SAMPLE_INTENSITY = " - Cường độ mẫu"
+IDEAL_INTENSITY = " - Cường độ lý tưởng"
+LIKING = "Ưa thích chung"
+RANK_PREFIX = "Thứ hạng - "
+# Scales of the evaluation form (layouts.py)
+INTENSITY_SCALE = (1, 100)
+PREFERENCE_SCALE = (1, 9)
+
+
+def format_timestamp(epoch_ms=None):
+    """
+    Formats a timestamp in Vietnam time; `epoch_ms` defaults to now.
+    """
+    if epoch_ms is None:
+        moment = datetime.now(TIMEZONE)
+    else:
+        moment = datetime.fromtimestamp(epoch_ms / 1000, TIMEZONE)
+    return moment.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def sample_record(username, user_info, sample_code, intensities, preference, timestamp=None):
+    """
+    Record for one evaluated sample. `intensities` maps each attribute to a
+    (sample intensity, ideal intensity) pair; `preference` is the 1-9 score.
+    """
+    rating = {}
+    for attr_name, (sample_value, ideal_value) in intensities.items():
+        rating[attr_name + SAMPLE_INTENSITY] = sample_value
+        rating[attr_name + IDEAL_INTENSITY] = ideal_value
+
+    return {
+        "username": username,
+        "sample": sample_code,
+        **user_info,
+        "timestamp": timestamp or format_timestamp(),
+        **rating,
+        LIKING: int(preference)
+    }
+
+
+def ranking_record(username, user_info, ranks, rank_titles=layouts.RANK_TITLES, timestamp=None):
+    """
+    Record holding the overall ranking, best sample first.
+    """
+    ranking_data = {RANK_PREFIX + rank_titles[i]: rank for i, rank in enumerate(ranks)}
+    return {
+        "username": username,
+        "sample": RANKING_SAMPLE, # Use a special value for sample
+        **user_info,
+        "timestamp": timestamp or format_timestamp(),
+        **ranking_data
+    }
+
+
+def intensities_of(record):
+    """
+    Inverse of sample_record: {attribute: (sample intensity, ideal intensity)}.
+    """
+    return {
+        key[:-len(SAMPLE_INTENSITY)]: (value, record.get(key[:-len(SAMPLE_INTENSITY)] + IDEAL_INTENSITY))
+        for key, value in record.items() if key.endswith(SAMPLE_INTENSITY)
+    }
+
+
+def user_info_of(record):
+    """
+    The user info fields copied into a sample or ranking record.
+    """
+    return {
+        key: value for key, value in record.items()
+        if key not in ("username", "sample", "timestamp", LIKING)
+        and not key.endswith((SAMPLE_INTENSITY, IDEAL_INTENSITY)) and not key.startswith(RANK_PREFIX)
+    }
+
+
+def ranks_of(record):
+    """
+    Inverse of ranking_record: [(rank title, sample code)], best first.
+    """
+    return [(key[len(RANK_PREFIX):], value) for key, value in record.items() if key.startswith(RANK_PREFIX)]
+
+
+def parse_preference(option):
+    """
+    "7 - Thích" -> 7
+    """
+    return int(str(option).split(" ")[0])
+
+
+def ranking_error(ranks):
+    """
+    Returns the warning to show for an invalid ranking, or None.
+    """
+    if not all(ranks):
+        return "❌ Vui lòng xếp hạng cho tất cả các mục."
+    if len(set(ranks)) != len(ranks):
+        return "❌ Mỗi sản phẩm chỉ được chọn một lần."
+    return None
+
+
+
+def _on_scale(value, scale, integer=False):
+    if isinstance(value, bool) or not isinstance(value, int if integer else (int, float)):
+        return False
+    return scale[0] <= value <= scale[1]
+
+
+def _valid_rating(rating, attributes):
+    intensities = rating.get("intensities")
+    if not isinstance(intensities, dict) or set(intensities) != set(attributes):
+        return False
+    for pair in intensities.values():
+        if not isinstance(pair, list) or len(pair) != 2 or not all(_on_scale(v, INTENSITY_SCALE) for v in pair):
+            return False
+    timestamp = rating.get("timestamp")
+    if timestamp is not None and not _on_scale(timestamp, (0, float("inf"))):
+        return False
+    return _on_scale(rating.get("preference"), PREFERENCE_SCALE, integer=True)
+
+
+def ratings_error(ratings, sample_codes, attributes):
+    """
+    Returns the error to show for sample ratings collected in the browser
+    (client-side paging), or None. They must cover exactly `sample_codes` in
+    order, rate exactly `attributes` on the slider scale and give a 1-9
+    liking score.
+    """
+    if not isinstance(ratings, list) or not all(isinstance(rating, dict) for rating in ratings):
+        return "❌ Dữ liệu đánh giá không hợp lệ. Vui lòng tải lại trang."
+    if [rating.get("sample") for rating in ratings] != list(sample_codes):
+        return "❌ Dữ liệu đánh giá không khớp với thứ tự mẫu. Vui lòng tải lại trang."
+    if not all(_valid_rating(rating, attributes) for rating in ratings):
+        return "❌ Dữ liệu đánh giá không hợp lệ. Vui lòng tải lại trang."
+    return None
@@ -0,0 +1,300 @@
+import json
+import threading
+from contextlib import contextmanager
+
+import records
+import storage
+
+# --- LOCAL RESULTS STORE ---
+# The system of record for study results. Every record produced by the
+# evaluation and ranking callbacks is appended here first; Google Sheets is
+# only a downstream mirror fed from this store by the outbox. Per-sample
+# ratings and rankings live in separate tables, each indexed by username,
+# sample and timestamp, so analysis and exports run locally in milliseconds
+# instead of paging through the Sheets API.
+#
+#   ratings            one row per evaluated sample (liking score, full record)
+#   rating_attributes  one row per (rating, attribute): sample/ideal intensity
+#   rankings           one row per final ranking (full record)
+#   ranking_positions  one row per (ranking, position): sample code
+#
+# Ratings and rankings carry the code of the study they belong to (see
+# studies.py). A submission stores each sample and its ranking only once, so
+# a submit sent twice (double click, client retry) is ignored.
+#
+# Each rating is committed as soon as its sample is submitted, so the store
+# also serves as the checkpoint of a session in progress: a panelist whose
+# browser crashed resumes after the last stored sample (unfinished_submission).
+
+_lock = threading.Lock()
+_schema_ready = set()
+
+
+def _db():
+    conn = storage.connect()
+    if storage.DB_PATH not in _schema_ready:
+        with _lock:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS ratings (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    submission_id TEXT NOT NULL,
+                    study TEXT,
+                    username TEXT NOT NULL,
+                    sample TEXT NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    liking INTEGER,
+                    record TEXT NOT NULL,
+                    UNIQUE (submission_id, sample)
+                );
+                CREATE INDEX IF NOT EXISTS ratings_study ON ratings (study, timestamp);
+                CREATE INDEX IF NOT EXISTS ratings_username ON ratings (username, timestamp);
+                CREATE INDEX IF NOT EXISTS ratings_sample ON ratings (sample, timestamp);
+                CREATE INDEX IF NOT EXISTS ratings_timestamp ON ratings (timestamp);
+
+                CREATE TABLE IF NOT EXISTS rating_attributes (
+                    rating_id INTEGER NOT NULL REFERENCES ratings (id),
+                    attribute TEXT NOT NULL,
+                    sample_intensity REAL,
+                    ideal_intensity REAL,
+                    PRIMARY KEY (rating_id, attribute)
+                );
+
+                CREATE TABLE IF NOT EXISTS rankings (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    submission_id TEXT NOT NULL UNIQUE,
+                    study TEXT,
+                    username TEXT NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    record TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS rankings_study ON rankings (study, timestamp);
+                CREATE INDEX IF NOT EXISTS rankings_username ON rankings (username, timestamp);
+                CREATE INDEX IF NOT EXISTS rankings_timestamp ON rankings (timestamp);
+
+                CREATE TABLE IF NOT EXISTS ranking_positions (
+                    ranking_id INTEGER NOT NULL REFERENCES rankings (id),
+                    position INTEGER NOT NULL,
+                    title TEXT NOT NULL,
+                    sample TEXT NOT NULL,
+                    PRIMARY KEY (ranking_id, position)
+                );
+                CREATE INDEX IF NOT EXISTS ranking_positions_sample ON ranking_positions (sample);
+            """)
+            _schema_ready.add(storage.DB_PATH)
+    return conn
+
+
+def _insert(conn, submission_id, record, study):
+    payload = json.dumps(record, ensure_ascii=False)
+    if record.get("sample") == records.RANKING_SAMPLE:
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO rankings (submission_id, study, username, timestamp, record) VALUES (?, ?, ?, ?, ?)",
+            (submission_id, study, record["username"], record["timestamp"], payload),
+        )
+        if not cursor.rowcount:
+            return
+        ranking_id = cursor.lastrowid
+        conn.executemany(
+            "INSERT INTO ranking_positions (ranking_id, position, title, sample) VALUES (?, ?, ?, ?)",
+            [(ranking_id, i + 1, title, sample) for i, (title, sample) in enumerate(records.ranks_of(record))],
+        )
+    else:
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO ratings (submission_id, study, username, sample, timestamp, liking, record) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (submission_id, study, record["username"], record["sample"], record["timestamp"],
+             record.get(records.LIKING), payload),
+        )
+        if not cursor.rowcount:
+            return
+        rating_id = cursor.lastrowid
+        conn.executemany(
+            "INSERT INTO rating_attributes (rating_id, attribute, sample_intensity, ideal_intensity) VALUES (?, ?, ?, ?)",
+            [(rating_id, attr, sample_value, ideal_value)
+             for attr, (sample_value, ideal_value) in records.intensities_of(record).items()],
+        )
+
+
+@contextmanager
+def transaction():
+    """
+    A write transaction (BEGIN IMMEDIATE) on this thread's connection. The
+    other local stores share that connection (storage.connect), so their
+    writes inside the block commit or roll back together with the records.
+    Joins the transaction already open on the connection, if any.
+    """
+    conn = _db()
+    if conn.in_transaction:
+        yield conn
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def append(submission_id, *new_records, study=None):
+    """
+    Appends records (as built by records.py) of one submission of `study`
+    atomically. A sample already rated in this submission, or a second
+    ranking, is ignored.
+    """
+    with transaction() as conn:
+        for record in new_records:
+            _insert(conn, submission_id, record, study)
+
+
+def submission_records(submission_id):
+    """
+    All records of one submission in the order they were produced: the
+    per-sample ratings followed by the ranking.
+    """
+    conn = _db()
+    rows = conn.execute("SELECT record FROM ratings WHERE submission_id = ? ORDER BY id", (submission_id,)).fetchall()
+    rows += conn.execute("SELECT record FROM rankings WHERE submission_id = ? ORDER BY id", (submission_id,)).fetchall()
+    return [json.loads(row[0]) for row in rows]
+
+
+def unfinished_submission(username, study=None, since=None):
+    """
+    The newest submission of `username` (in `study`) that has ratings but no
+    ranking yet, i.e. a session abandoned halfway, as (submission_id,
+    [rated sample codes in order], last rating record); None if there is
+    none. `since` bounds the rating timestamps like in ratings().
+    """
+    clauses, params = ["ratings.username = ?"], [username]
+    if study is not None:
+        # Unary + keeps SQLite on the per-username index instead of scanning the study
+        clauses.append("+ratings.study = ?")
+        params.append(study)
+    if since is not None:
+        clauses.append("ratings.timestamp >= ?")
+        params.append(since)
+    conn = _db()
+    row = conn.execute(
+        "SELECT submission_id FROM ratings WHERE " + " AND ".join(clauses) +
+        " AND NOT EXISTS (SELECT 1 FROM rankings WHERE rankings.submission_id = ratings.submission_id)"
+        " ORDER BY id DESC LIMIT 1",
+        params,
+    ).fetchone()
+    if row is None:
+        return None
+    rows = conn.execute("SELECT sample, record FROM ratings WHERE submission_id = ? ORDER BY id", (row[0],)).fetchall()
+    return row[0], [sample for sample, _ in rows], json.loads(rows[-1][1])
+
+
+def _where(username=None, sample=None, since=None, until=None, table="ratings", study=None):
+    clauses, params = [], []
+    if study is not None:
+        clauses.append(f"{table}.study = ?")
+        params.append(study)
+    if username is not None:
+        clauses.append(f"{table}.username = ?")
+        params.append(username)
+    if sample is not None:
+        if table == "ratings":
+            clauses.append("ratings.sample = ?")
+        else:
+            clauses.append("rankings.id IN (SELECT ranking_id FROM ranking_positions WHERE sample = ?)")
+        params.append(sample)
+    if since is not None:
+        clauses.append(f"{table}.timestamp >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append(f"{table}.timestamp <= ?")
+        params.append(until)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+def ratings(username=None, sample=None, since=None, until=None, study=None):
+    """
+    Long-format ratings: one row per (rating, attribute). `since`/`until`
+    are "YYYY-MM-DD[ HH:MM:SS]" bounds on the record timestamp.
+    """
+    import pandas as pd
+
+    where, params = _where(username, sample, since, until, "ratings", study)
+    return pd.read_sql_query(
+        "SELECT ratings.id AS rating_id, ratings.submission_id, ratings.study, ratings.username, ratings.sample, "
+        "ratings.timestamp, ratings.liking, a.attribute, a.sample_intensity, a.ideal_intensity "
+        "FROM ratings JOIN rating_attributes a ON a.rating_id = ratings.id" + where +
+        " ORDER BY ratings.id",
+        _db(), params=params,
+    )
+
+
+def rankings(username=None, sample=None, since=None, until=None, study=None):
+    """
+    Long-format rankings: one row per (ranking, position).
+    """
+    import pandas as pd
+
+    where, params = _where(username, sample, since, until, "rankings", study)
+    return pd.read_sql_query(
+        "SELECT rankings.id AS ranking_id, rankings.submission_id, rankings.study, rankings.username, "
+        "rankings.timestamp, "
+        "p.position, p.title, p.sample "
+        "FROM rankings JOIN ranking_positions p ON p.ranking_id = rankings.id" + where +
+        " ORDER BY rankings.id, p.position",
+        _db(), params=params,
+    )
+
+
+def iter_records(username=None, sample=None, since=None, until=None, chunk_size=1000, study=None):
+    """
+    Yields lists of at most `chunk_size` flat records (the Google Sheets
+    schema), ratings first, then rankings, without loading everything.
+    """
+    conn = _db()
+    for table in ("ratings", "rankings"):
+        where, params = _where(username, sample, since, until, table, study)
+        cursor = conn.execute(f"SELECT record FROM {table}{where} ORDER BY id", params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield [json.loads(row[0]) for row in rows]
+
+
+def ratings_after(rating_id, study=None):
+    """
+    Ratings and their attribute rows with an id above `rating_id`, for
+    incremental consumers: ([(id, sample, liking)], [(id, sample, liking,
+    attribute, sample_intensity, ideal_intensity)]), only those of `study`
+    if given. Writers hold the database lock from insert to commit, so ids
+    become visible in order and the highest id seen is a safe high-water mark.
+    """
+    study_clause, params = (" AND ratings.study = ?", (rating_id, study)) if study is not None else ("", (rating_id,))
+    conn = _db()
+    # One read transaction so both queries see the same snapshot
+    conn.execute("BEGIN")
+    try:
+        ratings_rows = conn.execute(
+            f"SELECT id, sample, liking FROM ratings WHERE id > ?{study_clause} ORDER BY id", params
+        ).fetchall()
+        attribute_rows = conn.execute(
+            "SELECT ratings.id, ratings.sample, ratings.liking, a.attribute, a.sample_intensity, a.ideal_intensity "
+            "FROM ratings JOIN rating_attributes a ON a.rating_id = ratings.id "
+            f"WHERE ratings.id > ?{study_clause} ORDER BY ratings.id",
+            params,
+        ).fetchall()
+    finally:
+        conn.execute("COMMIT")
+    return ratings_rows, attribute_rows
+
+
+def ranking_positions_after(ranking_id, study=None):
+    """
+    [(ranking id, position, sample)] of the rankings with an id above
+    `ranking_id`; see ratings_after.
+    """
+    study_clause, params = (" AND rankings.study = ?", (ranking_id, study)) if study is not None else ("", (ranking_id,))
+    return _db().execute(
+        "SELECT p.ranking_id, p.position, p.sample FROM ranking_positions p "
+        "JOIN rankings ON rankings.id = p.ranking_id "
+        f"WHERE p.ranking_id > ?{study_clause} ORDER BY p.ranking_id, p.position",
+        params,
+    ).fetchall()
@@ -0,0 +1,178 @@
+import hashlib
+import os
+import threading
+
+import metrics
+import storage
+
+# --- PANELIST ROSTER ---
+# The roster workbook is small but parsing it with openpyxl costs tens of
+# milliseconds, so it is loaded once per process and kept as a dict keyed by
+# username. The file is only parsed again when its mtime/size changes AND its
+# content hash differs from the one we loaded.
+#
+# The serving orders come either from the workbook's third column (one
+# "456 – 109 – 897" string per panelist) or, when the study lists its
+# samples, from the generated balanced design in orders.py, and the order
+# column may then be left out. Generated orders follow each panelist's seat:
+# their position in the order usernames first appeared in the workbook,
+# recorded in the shared database. Inserting a late registrant or deleting a
+# no-show mid-tasting therefore leaves everyone else's order unchanged.
+
+ROSTER_FILE = "Thứ tự câu hỏi Mía tăng lực.xlsx"
+
+
+def split_order(order):
+    """
+    Splits a presentation order such as "456 – 109 – 897" into sample codes.
+    """
+    return [code.strip() for code in str(order).replace("–", "-").split("-") if code.strip()]
+
+
+_schema_ready = set()
+
+
+def _db():
+    conn = storage.connect()
+    if storage.DB_PATH not in _schema_ready:
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS roster_seats (
+                roster TEXT NOT NULL,
+                username TEXT NOT NULL,
+                seat INTEGER NOT NULL,
+                PRIMARY KEY (roster, username)
+            );
+        """)
+        _schema_ready.add(storage.DB_PATH)
+    return conn
+
+
+def seats(roster, usernames):
+    """
+    The seat of each of `usernames` on `roster`: the position in which the
+    username first appeared there. New usernames take the next seats, in
+    the given order.
+    """
+    conn = _db()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        known = dict(conn.execute("SELECT username, seat FROM roster_seats WHERE roster = ?", (roster,)))
+        new = [username for username in dict.fromkeys(usernames) if username not in known]
+        first = max(known.values(), default=-1) + 1
+        known.update((username, first + i) for i, username in enumerate(new))
+        conn.executemany(
+            "INSERT INTO roster_seats (roster, username, seat) VALUES (?, ?, ?)",
+            [(roster, username, known[username]) for username in new],
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return [known[username] for username in usernames]
+
+
+class Panelist:
+    """
+    One row of the roster with its sample codes already split.
+    """
+    __slots__ = ("username", "password", "sample_codes")
+
+    def __init__(self, username, password, sample_codes):
+        self.username = username
+        self.password = password
+        self.sample_codes = tuple(sample_codes)
+
+
+class RosterCache:
+    """
+    Process-wide cache of the roster workbook, reloaded on change. With
+    `samples`, the orders are generated (see orders.presentation_orders) and
+    kept in `orders` as an int array of indices into `samples`.
+    """
+
+    def __init__(self, path=ROSTER_FILE, samples=None, per_panelist=None, seed=None):
+        self.path = path
+        self.samples = tuple(samples) if samples else None
+        self.per_panelist = per_panelist
+        self.seed = seed
+        self.orders = None
+        self._lock = threading.Lock()
+        self._panelists = None
+        self._stat = None
+        self._digest = None
+
+    def _read(self):
+        import pandas as pd
+
+        df = pd.read_excel(self.path)
+        df = df[df.iloc[:, 0].notna()]
+        usernames = [str(username) for username in df.iloc[:, 0]]
+        passwords = df.iloc[:, 1].astype(str).tolist()
+        if self.samples:
+            import orders
+
+            self.orders = orders.presentation_orders(
+                seats(self.path, usernames), len(self.samples), self.per_panelist, self.seed
+            )
+            codes = orders.sample_codes(self.orders, self.samples)
+        elif df.shape[1] > 2:
+            codes = [split_order(order) if not pd.isna(order) else [] for order in df.iloc[:, 2]]
+        else:
+            codes = [[] for _ in usernames]
+        return {
+            username: Panelist(username, password, sample_codes)
+            for username, password, sample_codes in zip(usernames, passwords, codes)
+        }
+
+    def _refresh(self):
+        """
+        Reloads the workbook if it changed on disk. Raises FileNotFoundError.
+        """
+        st = os.stat(self.path)
+        stat_key = (st.st_mtime_ns, st.st_size)
+        if self._panelists is not None and stat_key == self._stat:
+            metrics.inc("roster_cache_total", help="Roster lookups by cache outcome", result="hit")
+            return
+        with open(self.path, "rb") as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        if self._panelists is None or digest != self._digest:
+            metrics.inc("roster_cache_total", help="Roster lookups by cache outcome", result="reload")
+            with metrics.timed("roster_load_seconds", help="Time to parse the roster workbook"):
+                self._panelists = self._read()
+            self._digest = digest
+        else:
+            metrics.inc("roster_cache_total", help="Roster lookups by cache outcome", result="unchanged")
+        self._stat = stat_key
+
+    def panelists(self):
+        """
+        Returns the {username: Panelist} mapping, or None if the file is missing.
+        """
+        with self._lock:
+            try:
+                self._refresh()
+            except FileNotFoundError:
+                self._panelists = None
+                self._stat = None
+                self._digest = None
+            return self._panelists
+
+    def get(self, username):
+        panelists = self.panelists()
+        if panelists is None:
+            return None
+        return panelists.get(str(username))
+
+    def authenticate(self, username, password):
+        """
+        Returns the Panelist if the credentials match, otherwise None.
+        """
+        panelist = self.get(username)
+        if panelist is not None and panelist.password == str(password):
+            return panelist
+        return None
+
+    def sample_codes(self, username):
+        panelist = self.get(username)
+        return list(panelist.sample_codes) if panelist is not None else []
+
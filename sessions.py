@@ -0,0 +1,156 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import metrics
+import storage
+
+# --- SERVER-SIDE SESSIONS ---
+# The browser only keeps a small session token plus the current view; the
+# panelist's info lives here and the records collected so far are in the
+# results store, keyed by the same token, so callbacks exchange only the
+# current sample instead of the whole results list.
+#
+# SESSION_BACKEND=memory (default) keeps sessions in an in-process LRU, which
+# is enough for a single worker (gunicorn.conf.py switches to sqlite when it
+# starts several). SESSION_BACKEND=sqlite adds a SQLite tier shared by all
+# gunicorn workers (and surviving restarts); the LRU then acts as a read cache
+# validated by a per-session version number.
+
+SESSION_BACKEND = os.environ.get("SESSION_BACKEND", "memory")
+MAX_SESSIONS = int(os.environ.get("SESSION_CACHE_SIZE", "2000"))
+
+
+class Session:
+    """
+    One panelist session: arbitrary small fields.
+    """
+    __slots__ = ("token", "data", "version")
+
+    def __init__(self, token, data=None, version=0):
+        self.token = token
+        self.data = data or {}
+        self.version = version
+
+
+class SessionStore:
+    def __init__(self, backend=SESSION_BACKEND, max_sessions=MAX_SESSIONS):
+        self.backend = backend
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._schema_ready = False
+
+    # --- SQLite tier ---
+    def _db(self):
+        conn = storage.connect()
+        if not self._schema_ready:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    token TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    version INTEGER NOT NULL DEFAULT 0,
+                    updated_at REAL NOT NULL
+                );
+            """)
+            self._schema_ready = True
+        return conn
+
+    def _load(self, token):
+        conn = self._db()
+        row = conn.execute("SELECT data, version FROM sessions WHERE token = ?", (token,)).fetchone()
+        if row is None:
+            return None
+        return Session(token, json.loads(row[0]), row[1])
+
+    # --- LRU tier ---
+    def _remember(self, session):
+        with self._lock:
+            self._cache[session.token] = session
+            self._cache.move_to_end(session.token)
+            while len(self._cache) > self.max_sessions:
+                self._cache.popitem(last=False)
+
+    def _cached(self, token):
+        with self._lock:
+            session = self._cache.get(token)
+            if session is not None:
+                self._cache.move_to_end(token)
+            return session
+
+    # --- Public API ---
+    def create(self, token=None, **data):
+        """
+        Starts a new session and returns its token. With `token`, the session
+        is (re)created under that token, e.g. to resume a submission.
+        """
+        session = Session(token or uuid.uuid4().hex, data)
+        if self.backend == "sqlite":
+            self._db().execute(
+                "INSERT OR REPLACE INTO sessions (token, data, version, updated_at) VALUES (?, ?, 0, ?)",
+                (session.token, json.dumps(data, ensure_ascii=False), time.time()),
+            )
+        self._remember(session)
+        return session.token
+
+    def get(self, token):
+        """
+        Returns the Session for `token`, or None if it is unknown/expired.
+        """
+        if not token:
+            return None
+        session = self._cached(token)
+        if self.backend != "sqlite":
+            metrics.inc("session_cache_total", help="Session lookups by cache outcome", result="hit" if session else "miss")
+            return session
+        if session is not None:
+            row = self._db().execute("SELECT version FROM sessions WHERE token = ?", (token,)).fetchone()
+            if row is not None and row[0] == session.version:
+                metrics.inc("session_cache_total", result="hit")
+                return session
+        metrics.inc("session_cache_total", result="miss")
+        session = self._load(token)
+        if session is not None:
+            self._remember(session)
+        return session
+
+    def update(self, token, **fields):
+        """
+        Sets fields of the session's data.
+        """
+        session = self.get(token)
+        if session is None:
+            return None
+        session.data.update(fields)
+        self._bump(session, "UPDATE sessions SET data = ? WHERE token = ?",
+                   (json.dumps(session.data, ensure_ascii=False), token))
+        return session
+
+    def _bump(self, session, sql, params):
+        if self.backend != "sqlite":
+            return
+        conn = self._db()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(sql, params)
+            conn.execute(
+                "UPDATE sessions SET version = version + 1, updated_at = ? WHERE token = ?",
+                (time.time(), session.token),
+            )
+            version = conn.execute("SELECT version FROM sessions WHERE token = ?", (session.token,)).fetchone()[0]
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if version == session.version + 1:
+            session.version = version
+        else:
+            # Another worker changed this session concurrently; reload next time
+            with self._lock:
+                self._cache.pop(session.token, None)
+
+
+sessions = SessionStore()
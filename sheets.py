@@ -0,0 +1,153 @@
+import os
+import threading
+
+import metrics
+import ratelimit
+
+# ID of the Google Sheet that receives the results
+SHEET_ID = "13XRlhwoQY-ErLy75l8B0fOv-KyIoO6p_VlzkoUnfUl0"
+
+# SHEETS_BACKEND=stub swaps Google Sheets for the in-memory stand-in from
+# sheets_stub.py (for load tests and offline runs)
+SHEETS_BACKEND = os.environ.get("SHEETS_BACKEND", "google")
+
+# --- GOOGLE SHEETS CONNECTION ---
+# One client per worker process. gspread's authorized session refreshes the
+# service-account token by itself when it expires, so the OAuth exchange only
+# happens once per process instead of once per save. Worksheet handles and
+# the header row are cached per sheet ID; the cache for a sheet is dropped
+# whenever a write to it fails, so the next attempt re-reads the real headers.
+# Every API call goes through the shared rate limiter (ratelimit.py), which
+# also retries quota (429) and server (5xx) errors with backoff.
+# gspread and gspread_dataframe are only imported on first use, which keeps
+# them out of worker start-up.
+_lock = threading.Lock()
+_client = None
+_client_pid = None
+_worksheets = {}
+_headers = {}
+
+
+def connect_to_google_sheets():
+    """
+    Returns the pooled Google Sheets client, connecting on first use with the
+    local credentials.json file.
+    NOTE: For production, use environment variables instead of a file.
+    """
+    global _client, _client_pid
+    if _client is not None and _client_pid == os.getpid():
+        return _client
+    with _lock:
+        if _client is None or _client_pid != os.getpid():
+            try:
+                with metrics.timed("sheets_call_seconds", stage="auth"):
+                    if SHEETS_BACKEND == "stub":
+                        import sheets_stub
+                        _client = sheets_stub.client_from_env()
+                    else:
+                        import gspread
+
+                        # For this version, we read a local file named 'credentials.json'
+                        # This file should be in the same directory as your app.py
+                        _client = gspread.service_account(filename="credentials.json")
+                _client_pid = os.getpid()
+                _worksheets.clear()
+                _headers.clear()
+            except Exception as e:
+                print(f"Lỗi kết nối Google Sheets: {e}")
+                return None
+    return _client
+
+
+def get_worksheet(client, sheet_id):
+    """
+    Returns the first worksheet of `sheet_id`, reusing the cached handle.
+    """
+    cached = _worksheets.get(sheet_id)
+    if cached is not None and cached[0] is client:
+        metrics.inc("sheets_cache_total", help="Sheets handle/header cache lookups", cache="worksheet", result="hit")
+        return cached[1]
+    metrics.inc("sheets_cache_total", help="Sheets handle/header cache lookups", cache="worksheet", result="miss")
+    with metrics.timed("sheets_call_seconds", help="Google Sheets API calls by stage", stage="open"):
+        # open_by_key and get_worksheet each fetch the spreadsheet metadata
+        worksheet = ratelimit.call(lambda: client.open_by_key(sheet_id).get_worksheet(0),
+                                   cost=2, priority=ratelimit.READ)
+    _worksheets[sheet_id] = (client, worksheet)
+    _headers.pop(sheet_id, None)
+    return worksheet
+
+
+def invalidate(sheet_id):
+    """
+    Forgets the cached worksheet handle and header row of `sheet_id`.
+    """
+    _worksheets.pop(sheet_id, None)
+    _headers.pop(sheet_id, None)
+
+
+def append_to_google_sheet(dataframe, sheet_id, client):
+    """
+    Appends a DataFrame to a specified Google Sheet.
+    Returns True on success, False on failure.
+    """
+    if client is None:
+        print("Không thể ghi vào Google Sheet do kết nối không thành công.")
+        return False
+    import gspread
+    from gspread_dataframe import set_with_dataframe
+
+    try:
+        worksheet = get_worksheet(client, sheet_id)
+        existing_headers = _headers.get(sheet_id)
+        from_cache = existing_headers is not None
+        if existing_headers is None:
+            metrics.inc("sheets_cache_total", cache="header", result="miss")
+            with metrics.timed("sheets_call_seconds", stage="header_read"):
+                existing_headers = ratelimit.call(worksheet.row_values, 1, priority=ratelimit.READ)
+        else:
+            metrics.inc("sheets_cache_total", cache="header", result="hit")
+
+        if not existing_headers:
+            with metrics.timed("sheets_call_seconds", stage="append"):
+                # resize + update_cells
+                ratelimit.call(set_with_dataframe, worksheet, dataframe, cost=2)
+            _headers[sheet_id] = list(dataframe.columns)
+            print("Đã lưu kết quả (với header mới) vào Google Sheet thành công!")
+            return True
+
+        # Ensure all columns from the dataframe exist in the sheet, add if they don't
+        existing_headers = list(existing_headers)
+        new_headers = [h for h in dataframe.columns if h not in existing_headers]
+        if new_headers and from_cache:
+            # Another worker may have extended row 1 since we cached it;
+            # writing at our stale last column would overwrite its headers
+            metrics.inc("sheets_cache_total", cache="header", result="stale_check")
+            with metrics.timed("sheets_call_seconds", stage="header_read"):
+                existing_headers = list(ratelimit.call(worksheet.row_values, 1, priority=ratelimit.READ))
+            new_headers = [h for h in dataframe.columns if h not in existing_headers]
+        if new_headers:
+            last_col = len(existing_headers)
+            with metrics.timed("sheets_call_seconds", stage="header_write"):
+                ratelimit.call(worksheet.update, range_name=gspread.utils.rowcol_to_a1(1, last_col + 1), values=[new_headers])
+            existing_headers.extend(new_headers)
+        _headers[sheet_id] = existing_headers
+
+        # Fill missing columns in dataframe with None to match sheet headers
+        for header in existing_headers:
+            if header not in dataframe.columns:
+                dataframe[header] = None
+
+        ordered_df = dataframe[existing_headers]
+        # NaN is not valid JSON for the API; send empty cells instead
+        ordered_df = ordered_df.astype(object).where(ordered_df.notna(), "")
+        values_to_append = ordered_df.values.tolist()
+        with metrics.timed("sheets_call_seconds", stage="append"):
+            ratelimit.call(worksheet.append_rows, values_to_append, value_input_option='USER_ENTERED')
+        print("Đã lưu kết quả vào Google Sheet thành công!")
+        return True
+    except Exception as e:
+        # The sheet may have changed underneath us (columns added/moved,
+        # worksheet replaced): refetch handle and headers on the next write
+        invalidate(sheet_id)
+        print(f"Lỗi khi ghi vào Google Sheet: {e}")
+        return False
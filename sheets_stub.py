@@ -0,0 +1,153 @@
+import json
+import os
+import random
+import threading
+import time
+
+import gspread
+import requests
+
+# --- LOCAL GOOGLE SHEETS STAND-IN ---
+# In-memory objects implementing the part of the gspread API the app uses
+# (open_by_key -> get_worksheet -> row_values/update/append_rows, plus what
+# gspread_dataframe.set_with_dataframe needs). Used to exercise the upload
+# path without network access or API quota. Every API call can be slowed
+# down (`latency`) and fail with a 429 like the real quota limiter, either at
+# random (`quota_error_rate`) or once more than `quota_per_minute` calls were
+# made in the last 60 seconds.
+
+
+def quota_error(code=429, message="Quota exceeded for quota metric 'Write requests'"):
+    """
+    Builds a gspread APIError as raised for an HTTP error response.
+    """
+    response = requests.Response()
+    response.status_code = code
+    response._content = json.dumps({"error": {"code": code, "message": message, "status": "RESOURCE_EXHAUSTED"}}).encode()
+    return gspread.exceptions.APIError(response)
+
+
+class FakeWorksheet:
+    def __init__(self, title="Sheet1", spreadsheet=None):
+        self.title = title
+        self.spreadsheet = spreadsheet
+        self.rows = []
+        self.row_count = 1000
+        self.col_count = 26
+        self.calls = {}
+
+    def _call(self, name):
+        if self.spreadsheet is not None:
+            self.spreadsheet.client.api_call(name)
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def _cell_row(self, row):
+        while len(self.rows) < row:
+            self.rows.append([])
+        return self.rows[row - 1]
+
+    def row_values(self, row):
+        self._call("row_values")
+        values = list(self.rows[row - 1]) if row <= len(self.rows) else []
+        # Like the real API, trailing empty cells are not returned
+        while values and values[-1] in (None, ""):
+            values.pop()
+        return values
+
+    def update(self, range_name=None, values=None, **kwargs):
+        self._call("update")
+        row, col = gspread.utils.a1_to_rowcol(range_name)
+        for r, value_row in enumerate(values):
+            cells = self._cell_row(row + r)
+            for c, value in enumerate(value_row):
+                while len(cells) < col + c:
+                    cells.append("")
+                cells[col + c - 1] = value
+
+    def update_cells(self, cell_list, value_input_option=None):
+        self._call("update_cells")
+        for cell in cell_list:
+            cells = self._cell_row(cell.row)
+            while len(cells) < cell.col:
+                cells.append("")
+            cells[cell.col - 1] = cell.value
+
+    def append_rows(self, values, value_input_option=None, **kwargs):
+        self._call("append_rows")
+        self.rows.extend(list(row) for row in values)
+
+    def resize(self, rows=None, cols=None):
+        self._call("resize")
+        if rows is not None:
+            self.row_count = rows
+        if cols is not None:
+            self.col_count = cols
+
+    def get_all_records(self):
+        headers = self.rows[0] if self.rows else []
+        return [dict(zip(headers, row)) for row in self.rows[1:]]
+
+
+class FakeSpreadsheet:
+    def __init__(self, sheet_id, client):
+        self.id = sheet_id
+        self.client = client
+        self.worksheets = [FakeWorksheet(spreadsheet=self)]
+
+    def get_worksheet(self, index):
+        return self.worksheets[index]
+
+
+class FakeClient:
+    def __init__(self, latency=0.0, quota_error_rate=0.0, quota_per_minute=None, seed=None):
+        self.spreadsheets = {}
+        self.latency = latency
+        self.quota_error_rate = quota_error_rate
+        self.quota_per_minute = quota_per_minute
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._recent_calls = []
+
+    def api_call(self, name):
+        """
+        Simulates one API round trip: waits `latency` seconds, then raises a
+        429 APIError if the call is over quota.
+        """
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            now = time.monotonic()
+            self._recent_calls = [t for t in self._recent_calls if t > now - 60]
+            over_quota = self.quota_per_minute is not None and len(self._recent_calls) >= self.quota_per_minute
+            if over_quota or (self.quota_error_rate and self._random.random() < self.quota_error_rate):
+                self.errors += 1
+                raise quota_error()
+            self._recent_calls.append(now)
+
+    def open_by_key(self, key):
+        self.api_call("open_by_key")
+        if key not in self.spreadsheets:
+            self.spreadsheets[key] = FakeSpreadsheet(key, self)
+        return self.spreadsheets[key]
+
+    def worksheet(self, key, index=0):
+        """
+        Direct access to a worksheet's contents (not counted as an API call).
+        """
+        if key not in self.spreadsheets:
+            self.spreadsheets[key] = FakeSpreadsheet(key, self)
+        return self.spreadsheets[key].get_worksheet(index)
+
+
+def client_from_env():
+    """
+    FakeClient configured by SHEETS_STUB_LATENCY, SHEETS_STUB_QUOTA_ERROR_RATE
+    and SHEETS_STUB_QUOTA_PER_MINUTE.
+    """
+    quota_per_minute = os.environ.get("SHEETS_STUB_QUOTA_PER_MINUTE")
+    return FakeClient(
+        latency=float(os.environ.get("SHEETS_STUB_LATENCY", "0")),
+        quota_error_rate=float(os.environ.get("SHEETS_STUB_QUOTA_ERROR_RATE", "0")),
+        quota_per_minute=int(quota_per_minute) if quota_per_minute else None,
+    )
@@ -0,0 +1,34 @@
+import os
+import sqlite3
+import threading
+
+# --- LOCAL STORAGE ---
+# Every server-side store (outbox, sessions, results...) lives in one SQLite
+# database in WAL mode so several gunicorn workers can share it safely.
+
+DATA_DIR = os.environ.get("DATA_DIR", "data")
+DB_PATH = os.environ.get("DB_PATH", os.path.join(DATA_DIR, "panel.db"))
+
+_local = threading.local()
+
+
+def connect(path=None):
+    """
+    Returns a per-thread connection to the SQLite database at `path`.
+    """
+    path = path or DB_PATH
+    conns = getattr(_local, "conns", None)
+    if conns is None or getattr(_local, "pid", None) != os.getpid():
+        conns = _local.conns = {}
+        _local.pid = os.getpid()
+    conn = conns.get(path)
+    if conn is None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        conns[path] = conn
+    return conn
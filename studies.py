@@ -0,0 +1,202 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from urllib.parse import parse_qs
+
+import layouts
+import metrics
+import sheets
+from roster import ROSTER_FILE, RosterCache
+
+# --- STUDY REGISTRY ---
+# One process can host several product tests at once. Each study has its own
+# roster workbook, attribute list, rank titles and output sheet, and is
+# reached under its own URL prefix (/<code>) or with ?study=<code>. The
+# studies are listed in STUDIES_FILE (JSON, reloaded when it changes):
+#
+#   {"mia-tang-luc": {"title": "Mía tăng lực", "roster_file": "....xlsx",
+#                     "sheet_id": "13XR...", "attributes": [...], "rank_titles": [...],
+#                     "samples": ["456", "109", ...], "samples_per_panelist": 4, "order_seed": 1}}
+#
+# With "samples", serving orders are generated as a balanced Williams design,
+# or a balanced incomplete block design when "samples_per_panelist" is less
+# than the number of samples (see orders.py and roster.py), instead of read
+# from the workbook.
+# Missing fields fall back to the original single-study settings; without a
+# studies file the app serves exactly that one study as DEFAULT_STUDY. A file
+# that cannot be used (invalid JSON, unknown settings) is reported and the
+# last good configuration stays in effect.
+#
+# The parsed rosters are the per-study state worth caching; they are kept for
+# the MAX_ACTIVE_STUDIES most recently used studies. Evicting a study drops
+# its roster and its cached worksheet handle. View templates (layouts.py) are
+# keyed by attributes/rank titles/sample codes, so studies sharing an
+# attribute list also share templates.
+
+STUDIES_FILE = os.environ.get("STUDIES_FILE", "studies.json")
+MAX_ACTIVE_STUDIES = int(os.environ.get("MAX_ACTIVE_STUDIES", "16"))
+DEFAULT_STUDY = "default"
+
+
+class Study:
+    """
+    Settings of one study.
+    """
+    __slots__ = ("code", "title", "roster_file", "sheet_id", "attributes", "rank_titles",
+                 "samples", "samples_per_panelist", "order_seed")
+
+    def __init__(self, code, title=None, roster_file=ROSTER_FILE, sheet_id=sheets.SHEET_ID,
+                 attributes=layouts.ATTRIBUTES, rank_titles=layouts.RANK_TITLES,
+                 samples=None, samples_per_panelist=None, order_seed=None):
+        self.code = code
+        self.title = title or code
+        self.roster_file = roster_file
+        self.sheet_id = sheet_id
+        self.attributes = tuple(attributes)
+        self.rank_titles = tuple(rank_titles)
+        self.samples = tuple(str(sample) for sample in samples) if samples else None
+        if self.samples and samples_per_panelist is not None:
+            import orders
+
+            orders.check_design(len(self.samples), samples_per_panelist)
+        self.samples_per_panelist = samples_per_panelist
+        self.order_seed = order_seed
+
+    def _key(self):
+        return (self.code, self.title, self.roster_file, self.sheet_id, self.attributes, self.rank_titles,
+                self.samples, self.samples_per_panelist, self.order_seed)
+
+    def __eq__(self, other):
+        return isinstance(other, Study) and self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+
+class StudyRegistry:
+    """
+    The studies served by this process and their cached rosters.
+    """
+
+    def __init__(self, path=STUDIES_FILE, max_active=MAX_ACTIVE_STUDIES):
+        self.path = path
+        self.max_active = max_active
+        self._lock = threading.RLock()
+        self._studies = None
+        self._stat = None
+        self._rosters = OrderedDict()
+
+    def _read(self):
+        """
+        Parses the studies file. Raises ValueError (or OSError) if it cannot
+        be used.
+        """
+        with open(self.path, encoding="utf-8") as f:
+            config = json.load(f)
+        if not isinstance(config, dict):
+            raise ValueError("expected an object of studies")
+        studies = {}
+        for code, settings in config.items():
+            if not isinstance(settings, dict):
+                raise ValueError(f"study '{code}': expected an object of settings")
+            unknown = set(settings) - set(Study.__slots__[1:])
+            if unknown:
+                raise ValueError(f"study '{code}': unknown settings {', '.join(sorted(unknown))}")
+            try:
+                studies[code] = Study(code, **settings)
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"study '{code}': {e}") from e
+        return studies
+
+    def _refresh(self):
+        try:
+            st = os.stat(self.path)
+            stat_key = (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            stat_key = None
+        if self._studies is not None and stat_key == self._stat:
+            return
+        if stat_key is None:
+            studies = {DEFAULT_STUDY: Study(DEFAULT_STUDY)}
+        else:
+            try:
+                studies = self._read()
+            except (OSError, ValueError) as e:
+                # A bad edit must not take down the running studies; it is
+                # reported once per change of the file
+                print(f"Lỗi trong file '{self.path}', giữ cấu hình trước đó: {e}")
+                metrics.inc("studies_config_errors_total", help="Unusable versions of the studies file")
+                self._stat = stat_key
+                if self._studies is None:
+                    self._studies = {}
+                return
+        # Studies whose settings changed or that were removed start from scratch
+        for code, study in (self._studies or {}).items():
+            if studies.get(code) != study:
+                self.evict(code)
+        self._studies = studies
+        self._stat = stat_key
+
+    def studies(self):
+        """
+        Returns the {code: Study} mapping.
+        """
+        with self._lock:
+            self._refresh()
+            return self._studies
+
+    def get(self, code):
+        if code is None:
+            return None
+        return self.studies().get(code)
+
+    def resolve(self, pathname=None, search=None):
+        """
+        The study selected by a URL: the first path segment or ?study=<code>.
+        Without either, the only study (or DEFAULT_STUDY) if there is one.
+        """
+        studies = self.studies()
+        segment = (pathname or "").strip("/").split("/")[0]
+        code = parse_qs((search or "").lstrip("?")).get("study", [None])[0] or segment
+        if code:
+            return studies.get(code)
+        if len(studies) == 1:
+            return next(iter(studies.values()))
+        return studies.get(DEFAULT_STUDY)
+
+    def roster(self, study):
+        """
+        The RosterCache of `study`, kept for the most recently used studies.
+        """
+        with self._lock:
+            cache = self._rosters.get(study.code)
+            if cache is not None and cache.path == study.roster_file:
+                self._rosters.move_to_end(study.code)
+                metrics.inc("study_cache_total", help="Per-study cache lookups", result="hit")
+                return cache
+            metrics.inc("study_cache_total", result="miss")
+            cache = self._rosters[study.code] = RosterCache(
+                study.roster_file, study.samples, study.samples_per_panelist, study.order_seed
+            )
+            while len(self._rosters) > self.max_active:
+                self.evict(next(iter(self._rosters)))
+            return cache
+
+    def evict(self, code):
+        """
+        Drops the cached state of study `code`.
+        """
+        with self._lock:
+            if self._rosters.pop(code, None) is not None:
+                metrics.inc("study_cache_total", result="evict")
+            study = (self._studies or {}).get(code)
+            if study is not None:
+                sheets.invalidate(study.sheet_id)
+
+
+registry = StudyRegistry()
+
+metrics.register_collector(lambda: [
+    ("studies_active", "gauge", "Studies with a cached roster in this process", {}, len(registry._rosters)),
+])
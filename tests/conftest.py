@@ -0,0 +1,111 @@
+import os
+import sys
+import tempfile
+
+# The modules read their settings at import time: point them at a throw-away
+# data directory and the local Sheets stand-in before anything imports them
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="panel-tests-")
+os.environ["SHEETS_BACKEND"] = "stub"
+os.environ["METRICS_LOG"] = "0"
+os.environ["BATCH_WINDOW"] = "3600"  # the tests flush the outbox themselves
+os.chdir(ROOT)
+sys.path.insert(0, ROOT)
+
+import pytest  # noqa: E402
+
+import sheets  # noqa: E402
+import sheets_stub  # noqa: E402
+import storage  # noqa: E402
+
+
+@pytest.fixture
+def fake_sheets():
+    """
+    A FakeClient installed as the pooled Sheets client of this process.
+    """
+    client = sheets_stub.FakeClient()
+    sheets._client, sheets._client_pid = client, os.getpid()
+    sheets._worksheets.clear()
+    sheets._headers.clear()
+    yield client
+    sheets._client = None
+
+
+@pytest.fixture(autouse=True)
+def clean_store():
+    """
+    Every test starts from empty tables.
+    """
+    yield
+    conn = storage.connect()
+    tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+    for table in tables:
+        if table != "sqlite_sequence":
+            conn.execute(f"DELETE FROM {table}")
+
+
+class Panel:
+    """
+    Walks panelists through the app by calling the Dash callbacks directly.
+    """
+
+    def __init__(self):
+        import app
+        import studies
+
+        self.app = app
+        self.study = studies.registry.resolve()
+        self.roster = studies.registry.roster(self.study)
+
+    def panelists(self):
+        return list(self.roster.panelists().values())
+
+    def render(self, session_data):
+        page, session_data, _ = self.app.render_page_content(session_data, "/", "")
+        return page, session_data
+
+    def login(self, panelist):
+        _, session_data = self.render(None)
+        session_data, error = self.app.handle_login(1, panelist.username, panelist.password, session_data)
+        assert not error
+        return session_data
+
+    def user_info(self, session_data):
+        session_data, error = self.app.handle_user_info(
+            1, "Người thử", "Nam", 30, "Sinh viên", "1 lần/ tuần", session_data
+        )
+        assert not error
+        return self.app.start_evaluation(1, session_data)
+
+    def evaluate(self, session_data):
+        attributes = self.study.attributes
+        session_data, error = self.app.handle_evaluation(
+            1, [40] * len(attributes), [50] * len(attributes),
+            [{"type": "slider-sample", "index": attribute} for attribute in attributes],
+            "7 - Thích", session_data,
+        )
+        assert not error
+        return session_data
+
+    def rank(self, session_data):
+        sample_codes = sorted(self.roster.sample_codes(session_data["user"]))
+        session_data, error = self.app.handle_ranking(1, sample_codes, session_data)
+        assert not error
+        return session_data
+
+    def finish(self, panelist):
+        """
+        One complete session, ending on the thank-you view.
+        """
+        session_data = self.user_info(self.login(panelist))
+        while session_data["current_view"] == "evaluation":
+            session_data = self.evaluate(session_data)
+        session_data = self.rank(session_data)
+        _, session_data = self.render(session_data)
+        return session_data
+
+
+@pytest.fixture
+def panel(fake_sheets):
+    return Panel()
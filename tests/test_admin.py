@@ -0,0 +1,33 @@
+import base64
+import tempfile
+
+import pytest
+
+import admin
+
+AUTH = {"Authorization": "Basic " + base64.b64encode(b"admin:secret").decode()}
+
+
+@pytest.fixture
+def client(panel, monkeypatch, tmp_path):
+    monkeypatch.setattr(admin, "ADMIN_PASSWORD", "secret")
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    panel.finish(panel.panelists()[0])
+    return panel.app.server.test_client()
+
+
+def test_xlsx_export_removes_temporary_file(client, tmp_path):
+    with client.get("/admin/export?format=xlsx", headers=AUTH) as response:
+        assert response.status_code == 200
+        assert response.data[:2] == b"PK"
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_abandoned_export_removes_temporary_file(client, tmp_path):
+    # The client disconnects before the first chunk: the server closes the
+    # body without ever iterating it
+    with client.application.test_request_context("/admin/export?format=xlsx", headers=AUTH):
+        response = admin.export_results()
+    assert len(list(tmp_path.iterdir())) == 1
+    response.response.close()
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,89 @@
+import pytest
+
+import results_store
+import studies
+from sessions import sessions
+
+
+@pytest.fixture
+def evaluating(panel):
+    """
+    Session data of a panelist on the evaluation view.
+    """
+    return panel.user_info(panel.login(panel.panelists()[0]))
+
+
+def forget_sessions():
+    # What an LRU eviction, a restart or another worker's request looks like
+    with sessions._lock:
+        sessions._cache.clear()
+
+
+def test_user_info_without_session_goes_back_to_login(panel):
+    session_data = panel.login(panel.panelists()[0])
+    forget_sessions()
+    session_data, _ = panel.app.handle_user_info(1, "Người thử", "Nam", 30, "Sinh viên", "1 lần/ tuần", session_data)
+    assert session_data["current_view"] == "login"
+    assert session_data["token"] is None
+
+
+@pytest.mark.parametrize("submit", ["evaluate", "rank", "batch"])
+def test_submissions_without_session_go_back_to_login(panel, evaluating, submit):
+    forget_sessions()
+    if submit == "evaluate":
+        session_data = panel.evaluate(evaluating)
+    elif submit == "rank":
+        session_data = panel.rank(evaluating)
+    else:
+        sample_codes = panel.roster.sample_codes(evaluating["user"])
+        session_data, _ = panel.app.handle_batch_submission(1, sorted(sample_codes), [], evaluating)
+    assert session_data["current_view"] == "login"
+    assert session_data["study"] == panel.study.code
+    _, rendered = panel.render(session_data)
+    assert rendered["current_view"] == "login"
+
+
+
+def batch_ratings(panel, session_data):
+    return [
+        {"sample": sample, "intensities": {attribute: [40, 50] for attribute in panel.study.attributes},
+         "preference": 7, "timestamp": 1767225600000}
+        for sample in panel.roster.sample_codes(session_data["user"])
+    ]
+
+
+@pytest.mark.parametrize("tamper", [
+    lambda rating: rating.pop("intensities"),
+    lambda rating: rating.update(preference=None),
+    lambda rating: rating.update(preference=10),
+    lambda rating: rating["intensities"].update({"Invented attribute": [40, 50]}),
+    lambda rating: rating["intensities"].popitem(),
+    lambda rating: rating["intensities"].update({next(iter(rating["intensities"])): [0, 50]}),
+    lambda rating: rating["intensities"].update({next(iter(rating["intensities"])): [40]}),
+    lambda rating: rating.update(timestamp="yesterday"),
+])
+def test_batch_submission_rejects_invalid_ratings(panel, evaluating, tamper):
+    ratings = batch_ratings(panel, evaluating)
+    tamper(ratings[-1])
+    ranks = sorted(panel.roster.sample_codes(evaluating["user"]))
+    session_data, error = panel.app.handle_batch_submission(1, ranks, ratings, dict(evaluating))
+    assert error.color == "danger"
+    assert results_store.submission_records(evaluating["token"]) == []
+
+
+def test_batch_submission_stores_valid_ratings(panel, evaluating):
+    ratings = batch_ratings(panel, evaluating)
+    ranks = sorted(panel.roster.sample_codes(evaluating["user"]))
+    session_data, error = panel.app.handle_batch_submission(1, ranks, ratings, dict(evaluating))
+    assert not error
+    assert session_data["current_view"] == "thank_you"
+    assert len(results_store.submission_records(evaluating["token"])) == len(ratings) + 1
+
+
+def test_removed_study_goes_back_to_login(panel, evaluating, monkeypatch, tmp_path):
+    path = tmp_path / "studies.json"
+    path.write_text('{"other": {"title": "Other"}}', encoding="utf-8")
+    monkeypatch.setattr(studies.registry, "path", str(path))
+    session_data = panel.evaluate(evaluating)
+    assert session_data["current_view"] == "login"
+    assert results_store.submission_records(evaluating["token"]) == []
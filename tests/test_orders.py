@@ -0,0 +1,48 @@
+import itertools
+
+import numpy as np
+import pytest
+
+import orders
+import studies
+
+
+def counts(design, n_samples):
+    k = design.shape[1]
+    positions = np.zeros((n_samples, k), dtype=int)
+    np.add.at(positions, (design, np.broadcast_to(np.arange(k), design.shape)), 1)
+    pairs = np.zeros((n_samples, n_samples), dtype=int)
+    for a, b in itertools.combinations(range(k), 2):
+        np.add.at(pairs, (design[:, a], design[:, b]), 1)
+    pairs += pairs.T
+    carry_over = np.zeros((n_samples, n_samples), dtype=int)
+    np.add.at(carry_over, (design[:, :-1], design[:, 1:]), 1)
+    off_diagonal = ~np.eye(n_samples, dtype=bool)
+    return positions, pairs[off_diagonal], carry_over[off_diagonal]
+
+
+@pytest.mark.parametrize("n_samples, per_panelist", [(6, None), (5, None), (6, 3), (6, 4), (7, 3), (5, 2)])
+def test_full_repetition_is_balanced(n_samples, per_panelist):
+    size = orders.design_size(n_samples, per_panelist)
+    design = orders.presentation_orders(size, n_samples, per_panelist, seed=3)
+    for count in counts(design, n_samples):
+        assert count.min() == count.max() > 0
+
+
+def test_orders_follow_seats():
+    everyone = orders.presentation_orders(40, 6, 3, seed=1)
+    some = orders.presentation_orders(np.array([7, 2, 39]), 6, 3, seed=1)
+    assert (some == everyone[[7, 2, 39]]).all()
+
+
+@pytest.mark.parametrize("per_panelist", [0, 7, 2.5, True])
+def test_impossible_designs_are_rejected(per_panelist):
+    with pytest.raises(ValueError):
+        orders.presentation_orders(10, 6, per_panelist)
+    with pytest.raises(ValueError):
+        studies.Study("s", samples=list("abcdef"), samples_per_panelist=per_panelist)
+
+
+def test_oversized_design_is_rejected():
+    with pytest.raises(ValueError):
+        orders.check_design(30, 10)
@@ -0,0 +1,79 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import batching
+import outbox
+import records
+
+
+def sheet_rows(client, sheet_id):
+    worksheet = client.worksheet(sheet_id)
+    return worksheet.get_all_records()
+
+
+def test_repeated_renders_append_each_session_once(panel, fake_sheets):
+    sessions = [panel.finish(panelist) for panelist in panel.panelists()[:5]]
+
+    # Re-renders of the thank-you view (refreshes, polling, double clicks),
+    # interleaved with flushes and from several threads at once
+    def hammer(session_data):
+        for _ in range(20):
+            page, rendered = panel.render(dict(session_data))
+            assert rendered["outbox_id"] == session_data["outbox_id"]
+
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        futures = [pool.submit(hammer, session_data) for session_data in sessions]
+        outbox.flush_once(fake_sheets)
+        for future in futures:
+            future.result()
+    outbox.flush_once(fake_sheets)
+    for session_data in sessions:
+        panel.render(dict(session_data))
+    outbox.flush_once(fake_sheets)
+
+    assert outbox.pending_count() == 0
+    rows = sheet_rows(fake_sheets, panel.study.sheet_id)
+    for session_data in sessions:
+        samples = [row["sample"] for row in rows if row["username"] == session_data["user"]]
+        expected = list(panel.roster.sample_codes(session_data["user"])) + [records.RANKING_SAMPLE]
+        assert samples == expected
+
+
+def test_enqueue_is_idempotent(panel, fake_sheets):
+    session_data = panel.finish(panel.panelists()[0])
+    ids = {outbox.enqueue(session_data["token"], panel.study.sheet_id) for _ in range(50)}
+    assert ids == {session_data["outbox_id"]}
+    assert outbox.flush_once(fake_sheets) == 1
+    assert outbox.flush_once(fake_sheets) == 0
+
+
+def test_slow_send_keeps_its_claim(panel, fake_sheets, monkeypatch):
+    panel.finish(panel.panelists()[0])
+    monkeypatch.setattr(outbox, "CLAIM_TIMEOUT", 0.4)
+    write_batch = batching.write_batch
+    reclaimed = []
+
+    def slow_write(*args):
+        # A send stuck behind the rate limiter for longer than CLAIM_TIMEOUT,
+        # while another worker looks for abandoned entries
+        time.sleep(1.0)
+        reclaimed.extend(outbox._claim())
+        return write_batch(*args)
+
+    monkeypatch.setattr(batching, "write_batch", slow_write)
+    assert outbox.flush_once(fake_sheets) == 1
+    assert reclaimed == []
+    assert outbox.pending_count() == 0
+
+
+def test_ranking_is_queued_without_the_thank_you_render(panel, fake_sheets):
+    # The tablet goes offline right after the ranking is stored
+    session_data = panel.user_info(panel.login(panel.panelists()[0]))
+    while session_data["current_view"] == "evaluation":
+        session_data = panel.evaluate(session_data)
+    session_data = panel.rank(session_data)
+    assert session_data["current_view"] == "thank_you"
+
+    assert outbox.flush_once(fake_sheets) == 1
+    samples = [row["sample"] for row in sheet_rows(fake_sheets, panel.study.sheet_id)]
+    assert samples == list(panel.roster.sample_codes(session_data["user"])) + [records.RANKING_SAMPLE]
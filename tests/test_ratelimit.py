@@ -0,0 +1,105 @@
+import threading
+import time
+
+import gspread
+import pytest
+
+import ratelimit
+import sheets_stub
+import storage
+
+
+class FlakyClient(sheets_stub.FakeClient):
+    """
+    FakeClient whose first `failures` API calls fail with `code`.
+    """
+
+    def __init__(self, failures, code=429):
+        super().__init__()
+        self.failures = failures
+        self.code = code
+        self.attempts = 0
+
+    def api_call(self, name):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            self.errors += 1
+            raise sheets_stub.quota_error(self.code)
+        super().api_call(name)
+
+
+@pytest.fixture(autouse=True)
+def fast_limiter(monkeypatch):
+    monkeypatch.setattr(ratelimit, "BASE_BACKOFF", 0.01)
+    monkeypatch.setattr(ratelimit, "MAX_BACKOFF", 0.05)
+    monkeypatch.setattr(ratelimit, "MAX_RETRIES", 3)
+
+
+def append(client):
+    worksheet = client.worksheet("sheet")
+    ratelimit.call(worksheet.append_rows, [["a", 1]])
+    return worksheet
+
+
+def test_retries_429_then_succeeds():
+    client = FlakyClient(failures=2)
+    worksheet = append(client)
+    assert client.attempts == 3
+    assert worksheet.rows == [["a", 1]]
+
+
+def test_gives_up_after_max_retries():
+    client = FlakyClient(failures=100)
+    with pytest.raises(gspread.exceptions.APIError):
+        append(client)
+    assert client.attempts == ratelimit.MAX_RETRIES + 1
+    assert client.worksheet("sheet").rows == []
+
+
+@pytest.mark.parametrize("code", [400, 403])
+def test_other_api_errors_are_not_retried(code):
+    client = FlakyClient(failures=1, code=code)
+    with pytest.raises(gspread.exceptions.APIError):
+        append(client)
+    assert client.attempts == 1
+
+
+def test_other_exceptions_pass_through():
+    calls = []
+
+    def broken():
+        calls.append(1)
+        raise ValueError("not an API error")
+
+    with pytest.raises(ValueError):
+        ratelimit.call(broken)
+    assert calls == [1]
+
+
+def test_reads_wait_while_a_write_is_queued(monkeypatch):
+    # One token, refilled after a second
+    monkeypatch.setattr(ratelimit, "BURST", 1.0)
+    monkeypatch.setattr(ratelimit, "RATE_PER_MINUTE", 60.0)
+    monkeypatch.setattr(ratelimit, "READ_RESERVE", 0.0)
+    client = sheets_stub.FakeClient()
+    worksheet = client.worksheet("sheet")
+    ratelimit.acquire()  # empty the bucket
+
+    finished = []
+
+    def run(name, function, priority):
+        ratelimit.call(function, priority=priority)
+        finished.append(name)
+
+    writer = threading.Thread(target=run, args=("write", lambda: worksheet.append_rows([["a"]]), ratelimit.WRITE))
+    writer.start()
+    while not ratelimit.queue_depth()[ratelimit.WRITE]:
+        time.sleep(0.005)
+    time.sleep(0.05)
+    # A token becomes free while the writer sleeps: the read must leave it
+    storage.connect().execute("UPDATE rate_limit SET tokens = 1 WHERE name = ?", (ratelimit.BUCKET,))
+    reader = threading.Thread(target=run, args=("read", lambda: worksheet.row_values(1), ratelimit.READ))
+    reader.start()
+    writer.join(10)
+    reader.join(10)
+    assert finished == ["write", "read"]
@@ -0,0 +1,22 @@
+import records
+import results_store
+
+
+def test_double_submit_stores_sample_once(panel):
+    session_data = panel.user_info(panel.login(panel.panelists()[0]))
+    # Both requests carry the state the browser had before the first answer
+    first = panel.evaluate(dict(session_data))
+    second = panel.evaluate(dict(session_data))
+    assert first["sample_index"] == second["sample_index"] == 1
+
+    session_data = second
+    while session_data["current_view"] == "evaluation":
+        session_data = panel.evaluate(session_data)
+    panel.rank(dict(session_data))
+    panel.rank(dict(session_data))
+
+    samples = [record["sample"] for record in results_store.submission_records(session_data["token"])]
+    assert samples == list(panel.roster.sample_codes(session_data["user"])) + [records.RANKING_SAMPLE]
+    ratings = results_store.ratings()
+    assert len(ratings) == len(panel.study.attributes) * (len(samples) - 1)
+
@@ -0,0 +1,60 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+import results_store
+import studies
+
+SAMPLES = ["101", "202", "303", "404", "505"]
+
+
+def write_roster(path, usernames):
+    pd.DataFrame({"username": usernames, "password": ["pw"] * len(usernames)}).to_excel(path, index=False)
+    # A later modification time than the previous version, as a real edit has
+    mtime = os.stat(path).st_mtime_ns + 10 ** 9 * len(usernames)
+    os.utime(path, ns=(mtime, mtime))
+
+
+@pytest.fixture
+def generated(panel, monkeypatch, tmp_path):
+    """
+    The panel switched to a study whose orders are generated from SAMPLES.
+    """
+    roster_file = tmp_path / "roster.xlsx"
+    write_roster(roster_file, ["u1", "u2", "u3", "u4"])
+    config = tmp_path / "studies.json"
+    config.write_text(json.dumps({"gen": {
+        "roster_file": str(roster_file), "samples": SAMPLES, "samples_per_panelist": 3, "order_seed": 5,
+    }}), encoding="utf-8")
+    monkeypatch.setattr(studies.registry, "path", str(config))
+    panel.study = studies.registry.resolve()
+    panel.roster = studies.registry.roster(panel.study)
+    panel.roster_file = roster_file
+    return panel
+
+
+def test_roster_edit_keeps_orders(generated):
+    panel = generated
+    before = {username: panel.roster.sample_codes(username) for username in ["u1", "u2", "u3", "u4"]}
+    session_data = panel.user_info(panel.login(panel.roster.get("u3")))
+    session_data = panel.evaluate(session_data)
+
+    # Mid-tasting: a late registrant is added at the top, then no-shows
+    # are deleted
+    for usernames in (["late", "u1", "u2", "u3", "u4"], ["late", "u3", "u4"]):
+        write_roster(panel.roster_file, usernames)
+        assert sorted(panel.roster.panelists()) == sorted(usernames)
+        for username in usernames[1:]:
+            assert panel.roster.sample_codes(username) == before[username]
+
+    session_data = panel.evaluate(session_data)
+    stored = [record["sample"] for record in results_store.submission_records(session_data["token"])]
+    assert stored == before["u3"][:2]
+
+    # The browser crashes: logging in again resumes after the stored samples
+    resumed = panel.login(panel.roster.get("u3"))
+    assert resumed["current_view"] == "evaluation"
+    assert resumed["token"] == session_data["token"]
+    assert resumed["sample_index"] == 2
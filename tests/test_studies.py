@@ -0,0 +1,47 @@
+import itertools
+import json
+import os
+
+import pytest
+
+import studies
+
+
+_mtimes = itertools.count(1)
+
+
+def write(path, content):
+    path.write_text(content if isinstance(content, str) else json.dumps(content), encoding="utf-8")
+    # Every edit gets a later modification time, as a real edit would
+    mtime = next(_mtimes) * 10 ** 9
+    os.utime(path, ns=(mtime, mtime))
+
+
+@pytest.mark.parametrize("bad_edit", [
+    '{"a": {"title": "A"',
+    {"a": {"title": "A", "atributes": ["Vị ngọt"]}},
+    {"a": ["not", "settings"]},
+    ["a"],
+])
+def test_bad_edit_keeps_the_last_good_config(tmp_path, capsys, bad_edit):
+    path = tmp_path / "studies.json"
+    write(path, {"a": {"title": "A"}, "b": {"title": "B"}})
+    registry = studies.StudyRegistry(str(path))
+    assert set(registry.studies()) == {"a", "b"}
+
+    write(path, bad_edit)
+    assert set(registry.studies()) == {"a", "b"}
+    assert registry.get("a").title == "A"
+    assert "studies.json" in capsys.readouterr().out
+
+    write(path, {"a": {"title": "A2"}})
+    assert set(registry.studies()) == {"a"}
+    assert registry.get("a").title == "A2"
+
+
+def test_bad_first_config_serves_no_study(tmp_path):
+    path = tmp_path / "studies.json"
+    write(path, "{")
+    registry = studies.StudyRegistry(str(path))
+    assert registry.studies() == {}
+    assert registry.resolve() is None
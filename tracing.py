@@ -0,0 +1,171 @@
+import atexit
+import gzip
+import json
+import os
+import threading
+import time
+
+# --- CALLBACK TRACES ---
+# Opt-in recorder of real traffic for offline profiling. With TRACE_DIR set,
+# every request to one of the TRACE_CALLBACKS is appended, with its timing,
+# to a gzip-compressed JSON-lines file in that directory (one file per
+# process, so gunicorn workers never share a stream):
+#
+#   {"ts": <start, epoch s>, "callback": "handle_login", "ms": 12.3, "status": 200,
+#    "body": <the /_dash-update-component request: inputs, state...>,
+#    "session": <session token the response handed out, if any>}
+#
+# benchmarks/replay.py re-drives such traces through the app under a
+# profiler. Values of the components in TRACE_REDACT (the login password)
+# are not written; the replay takes them from the roster instead. The
+# traces still hold the panelists' answers and user info, so treat them
+# like the results themselves.
+
+TRACE_DIR = os.environ.get("TRACE_DIR", "")
+TRACE_CALLBACKS = set(os.environ.get(
+    "TRACE_CALLBACKS", "handle_login,handle_user_info,handle_evaluation,handle_ranking,render_page_content"
+).split(","))
+TRACE_REDACT = set(os.environ.get("TRACE_REDACT", "login-password").split(","))
+# Seconds between flushes of the compressed stream (a crash loses at most this much)
+TRACE_FLUSH_SECONDS = float(os.environ.get("TRACE_FLUSH_SECONDS", "1"))
+
+
+def _redact(items):
+    """
+    Drops the values of redacted components from a list of Dash
+    input/state entries.
+    """
+    redacted = []
+    for item in items:
+        if isinstance(item, dict) and item.get("id") in TRACE_REDACT:
+            item = {**item, "value": None}
+        redacted.append(item)
+    return redacted
+
+
+def session_token(body):
+    """
+    The session token a Dash request carries in its session-store input or state.
+    """
+    for item in body.get("inputs", []) + body.get("state", []):
+        if isinstance(item, dict) and item.get("id") == "session-store":
+            return (item.get("value") or {}).get("token")
+    return None
+
+
+class TraceWriter:
+    """
+    Appends trace entries to a per-process gzip JSON-lines file.
+    """
+
+    def __init__(self, directory=TRACE_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._file = None
+        self._pid = None
+        self._flushed = 0.0
+
+    def _open(self):
+        # Opened lazily: with a preloaded app the master imports this module
+        # and each forked worker must get its own file
+        if self._file is None or self._pid != os.getpid():
+            os.makedirs(self.directory, exist_ok=True)
+            name = f"trace-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.jsonl.gz"
+            self._file = gzip.open(os.path.join(self.directory, name), "ab")
+            self._pid = os.getpid()
+        return self._file
+
+    def write(self, entry):
+        line = (json.dumps(entry, ensure_ascii=False, separators=(",", ":"), default=str) + "\n").encode()
+        with self._lock:
+            f = self._open()
+            f.write(line)
+            now = time.monotonic()
+            if now - self._flushed >= TRACE_FLUSH_SECONDS:
+                f.flush()
+                self._flushed = now
+
+    def close(self):
+        with self._lock:
+            if self._file is not None and self._pid == os.getpid():
+                self._file.close()
+            self._file = None
+
+
+def install(dash_app, directory=TRACE_DIR):
+    """
+    Records the TRACE_CALLBACKS requests of the app's Flask server into
+    `directory`. Does nothing when `directory` is empty.
+    """
+    if not directory:
+        return None
+    from flask import g, request
+
+    server = dash_app.server
+    writer = TraceWriter(directory)
+    atexit.register(writer.close)
+    names = {}
+
+    def callback_name(body):
+        output = body.get("output", "")
+        name = names.get(output)
+        if name is None:
+            function = dash_app.callback_map.get(output, {}).get("callback")
+            name = names[output] = getattr(function, "__name__", None) or output
+        return name
+
+    @server.before_request
+    def _trace_start():
+        g.trace_start = (time.time(), time.perf_counter())
+
+    @server.after_request
+    def _trace_request(response):
+        start = g.pop("trace_start", None)
+        if start is None or not request.path.endswith("_dash-update-component"):
+            return response
+        # Parsed again from the raw bytes: callbacks modify the inputs they
+        # were given (request.get_json's cached result) in place
+        try:
+            body = json.loads(request.get_data())
+        except ValueError:
+            return response
+        name = callback_name(body)
+        if name not in TRACE_CALLBACKS:
+            return response
+        entry = {
+            "ts": round(start[0], 4),
+            "callback": name,
+            "ms": round((time.perf_counter() - start[1]) * 1000, 3),
+            "status": response.status_code,
+            "body": {**body, "inputs": _redact(body.get("inputs", [])), "state": _redact(body.get("state", []))},
+        }
+        # The replay needs to tell which later requests belong to the session
+        # a login created (a new token in the response)
+        if "session-store.data" in body.get("output", "") and response.status_code == 200:
+            store = ((response.get_json(silent=True) or {}).get("response") or {}).get("session-store") or {}
+            token = (store.get("data") or {}).get("token")
+            if token and token != session_token(body):
+                entry["session"] = token
+        writer.write(entry)
+        return response
+
+    return writer
+
+
+def read(paths):
+    """
+    The entries of trace files `paths`, ordered by start time. Files
+    of a process that is still running (or crashed) end without a gzip
+    trailer; everything flushed before that point is read.
+    """
+    entries = []
+    for path in paths:
+        with gzip.open(path, "rb") as f:
+            try:
+                for line in f:
+                    if line.endswith(b"\n"):
+                        entries.append(json.loads(line))
+            except (EOFError, gzip.BadGzipFile):
+                pass
+    entries.sort(key=lambda entry: entry["ts"])
+    return entries